@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+# benchmark of the classification pipeline on synthetic problem families
+#
+#   python benchmarks/bench.py --output before.json
+#   python benchmarks/bench.py --output after.json --compare before.json
+#
+# every phase is timed on the top level of the recursion as the deciders run
+# it: trim, shared_automaton (the automaton shared by all subproblems) and the
+# phases of the first flexible_scc_restrictions call (automaton, the one of
+# the subproblem cut out of it, scc, flexibility and, unrooted, restrict);
+# max_depth is the whole recursion on the trimmed problem
+# the "startup" case is the cold start of a fresh interpreter that imports
+# the package, and of the CLI classifying an empty batch
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from poly_classifier import rooted_poly_decider as rooted
+from poly_classifier import unrooted_poly_decider as unrooted
+from poly_classifier.problem import Problem
+from poly_classifier.stats import Stats
+
+from generators import suite
+
+
+def best_time(function, repeat):
+    # (minimum wall time over repeat runs, result of the last run)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def best_phases(function, repeat):
+    # (minimum time of every phase function(stats) records in stats over
+    # repeat runs, result of the last run)
+    best = {}
+    for _ in range(repeat):
+        stats = Stats()
+        result = function(stats)
+        for phase, seconds in stats.timings.items():
+            best[phase] = min(best.get(phase, float("inf")), seconds)
+    return best, result
+
+
+def phases_rooted(configurations, repeat):
+    # the deciders work on interned multisets (see Problem.multisets)
+    configurations = Problem(configurations).multisets()
+    labels = rooted.get_labels(configurations)
+    phases = {}
+    phases["trim"], trimmed = best_time(
+        lambda: rooted.trim(labels, configurations), repeat)
+    phases["shared_automaton"], automaton = best_time(
+        lambda: rooted.shared_automaton(trimmed, configurations), repeat)
+    top, _ = best_phases(
+        lambda stats: rooted.flexible_scc_restrictions(
+            trimmed, configurations, stats, automaton), repeat)
+    phases.update(top)
+    phases["max_depth"], k = best_time(
+        lambda: rooted.max_depth(trimmed, configurations), repeat)
+    return phases, k, len(automaton[0].nodes)
+
+
+def phases_unrooted(configurations, edge_configurations, repeat):
+    problem = Problem(configurations, edge_configurations)
+    configurations = problem.multisets()
+    compatibility = unrooted.get_compatibility(problem.edge_configurations())
+    phases = {}
+    phases["trim"], trimmed = best_time(
+        lambda: unrooted.trim(configurations, compatibility), repeat)
+    phases["shared_automaton"], automaton = best_time(
+        lambda: unrooted.shared_automaton(trimmed, compatibility), repeat)
+    top, _ = best_phases(
+        lambda stats: unrooted.flexible_scc_restrictions(
+            trimmed, compatibility, stats, automaton), repeat)
+    phases.update(top)
+    phases["max_depth"], k = best_time(
+        lambda: unrooted.max_depth(trimmed, compatibility), repeat)
+    return phases, k, len(automaton[0].nodes)
+
+
+def startup(repeat):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = {
+        "import": [sys.executable, "-c", "import poly_classifier"],
+        "cli": [sys.executable, "-m", "poly_classifier", "--batch", "-"],
+    }
+    phases = {}
+    for phase, command in commands.items():
+        phases[phase], _ = best_time(
+            lambda: subprocess.run(command, cwd=root, input=b"", check=True),
+            repeat)
+    return phases
+
+
+def run(scale, repeat):
+    phases = startup(repeat)
+    results = [{"family": "startup", "parameters": {}, "phases": phases}]
+    print(f"{'startup':16} {'':70} " +
+          " ".join(f"{phase}={seconds * 1000:.2f}ms"
+                   for phase, seconds in phases.items()),
+          file=sys.stderr)
+    unrooted.load_numpy()  # not part of any phase, as in the deciders
+    for name, parameters, generator in suite(scale):
+        configurations, edge_configurations = generator(**parameters)
+        if edge_configurations is None:
+            phases, k, nodes = phases_rooted(configurations, repeat)
+        else:
+            phases, k, nodes = phases_unrooted(configurations,
+                                               edge_configurations, repeat)
+        results.append({
+            "family": name,
+            "parameters": parameters,
+            "k": "inf" if k == float("inf") else k,
+            "automaton_nodes": nodes,
+            "phases": phases,
+        })
+        print(f"{name:16} {json.dumps(parameters):70} k={k!s:4} " +
+              " ".join(f"{phase}={seconds * 1000:.2f}ms"
+                       for phase, seconds in phases.items()),
+              file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True,
+                              text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline):
+    # print the time ratio current/baseline of every phase of every case
+    old = {
+        (r["family"], json.dumps(r["parameters"])): r
+        for r in baseline["results"]
+    }
+    for result in results:
+        key = (result["family"], json.dumps(result["parameters"]))
+        if key not in old:
+            continue
+        ratios = " ".join(f"{phase}={seconds / old[key]['phases'][phase]:.2f}x"
+                          for phase, seconds in result["phases"].items()
+                          if old[key]["phases"].get(phase))
+        print(f"{key[0]:16} {key[1]:70} {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare",
+                        help="JSON results of an earlier run to compare with")
+    parser.add_argument("--scale",
+                        type=int,
+                        default=1,
+                        help="size multiplier of the random families")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=3,
+                        help="report the best of this many runs")
+    args = parser.parse_args()
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "results": run(args.scale, args.repeat),
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(report["results"], json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
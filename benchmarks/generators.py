@@ -0,0 +1,83 @@
+# synthetic problem families for the benchmarks
+# every generator returns (configurations, edge_configurations), with
+# edge_configurations None for rooted problems
+import itertools
+import random
+
+
+def _label(i):
+    return f"l{i}"
+
+
+def random_rooted(labels, configurations, seed=0):
+    # as tests.testRandomRooted, with a tunable number of labels and density
+    rng = random.Random(seed)
+    ss = [_label(i) for i in range(labels)]
+    return [tuple(rng.choices(ss, k=3)) for _ in range(configurations)], None
+
+
+def random_unrooted(labels, configurations, edge_configurations, seed=0):
+    # as tests.testRandomUnrooted, with a tunable number of labels and density
+    rng = random.Random(seed)
+    ss = [_label(i) for i in range(labels)]
+    return ([tuple(rng.choices(ss, k=3)) for _ in range(configurations)],
+            [tuple(rng.choices(ss, k=2)) for _ in range(edge_configurations)])
+
+
+def k_rooted(k):
+    # rooted problem of complexity Θ(n^(1/k)), as in tests.testProblemGenerationRooted
+    def gen(l, s, t):
+        return [f'{l}{j}' for j in range(s, t + 1)]
+
+    configurations = []
+    for i in range(1, k + 1):
+        ss = gen('a', 1, i - 1) + gen('b', 1, i) + gen('x', 1, i - 1)
+        configurations.extend((f'a{i}', s1, s2) for s1 in ss for s2 in ss)
+    for i in range(1, k + 1):
+        ss = gen('a', 1, i) + gen('b', 1, i - 1) + gen('x', 1, i - 1)
+        configurations.extend((f'b{i}', s1, s2) for s1 in ss for s2 in ss)
+    for i in range(1, k):
+        ss1 = gen('a', 1, k) + gen('b', 1, k) + gen('x', 1, k - 1)
+        ss2 = gen('a', 1, i) + gen('b', 1, i) + gen('x', 1, i - 1)
+        configurations.extend((f'x{i}', s1, s2) for s1 in ss1 for s2 in ss2)
+    return configurations, None
+
+
+def k_unrooted(k):
+    # unrooted problem of complexity Θ(n^(1/k)), as tests.create_unrooted_k_problem
+    comp_confs = [(f"x{i}", f"x{i}", f"y{i}") for i in range(k)]
+    rake_confs = [(f"a{i}", f"b{i}", f"b{i}") for i in range(k)]
+    rake_star_confs = [(f"b{i}", f"b{i}", f"b{i}") for i in range(k)]
+    configurations = list(
+        itertools.chain(comp_confs, rake_confs, rake_star_confs))
+    edge_confs_1 = [(f"a{i}", f"a{i}") for i in range(k)] + [(f"x{i}", f"x{i}")
+                                                             for i in range(k)]
+    edge_confs_2 = [(f"x{i}", f"b{j}") for j in range(k) for i in range(k) if i < j] + \
+                   [(f"x{i}", f"y{j}") for j in range(k) for i in range(k) if i < j]
+    edge_confs_3 = [(f"a{i}", f"b{j}") for j in range(k) for i in range(k) if i <= j] + \
+                   [(f"a{i}", f"y{j}") for j in range(k) for i in range(k) if i <= j]
+    return configurations, list(
+        itertools.chain(edge_confs_1, edge_confs_2, edge_confs_3))
+
+
+def suite(scale=1):
+    # (name, parameters, generator) of every benchmarked problem
+    # scale multiplies the sizes of the random families
+    cases = []
+    for k in (2, 4, 8):
+        cases.append(("k_rooted", {"k": k}, k_rooted))
+        cases.append(("k_unrooted", {"k": k}, k_unrooted))
+    for labels, density in ((26, 3), (100, 5), (300, 8)):
+        parameters = {
+            "labels": labels * scale,
+            "configurations": labels * density * scale
+        }
+        cases.append(("random_rooted", parameters, random_rooted))
+    for labels, density in ((26, 1), (60, 2), (60, 4)):
+        parameters = {
+            "labels": labels * scale,
+            "configurations": labels * density * scale,
+            "edge_configurations": labels * density * scale
+        }
+        cases.append(("random_unrooted", parameters, random_unrooted))
+    return cases
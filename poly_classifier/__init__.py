@@ -1,4 +1,12 @@
+from .budget import Budget, BudgetExceeded
+from .cache import LRUCache, ResultCache
+from .canonical import canonical_form, canonical_key
+from .incremental import (IncrementalRootedClassifier,
+                          IncrementalUnrootedClassifier)
+from .parallel import classify_many
+from .problem import Problem
 from .rooted_poly_decider import rooted_polynomial_classifier
+from .stats import Stats
 from .unrooted_poly_decider import unrooted_polynomial_classifier
 
 __version__ = "0.0.1"
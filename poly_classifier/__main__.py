@@ -1,16 +1,28 @@
-import itertools
+import argparse
 import math
+import sys
 
 try:
+    from .batch import run_batch
+    from .budget import Budget
+    from .cache import ResultCache
+    from .parser import parse_configuration
     from .rooted_poly_decider import rooted_polynomial_classifier
+    from .stats import Stats
     from .unrooted_poly_decider import unrooted_polynomial_classifier
 except ImportError:
     from poly_classifier import rooted_polynomial_classifier
     from poly_classifier import unrooted_polynomial_classifier
+    from poly_classifier.batch import run_batch
+    from poly_classifier.budget import Budget
+    from poly_classifier.cache import ResultCache
+    from poly_classifier.parser import parse_configuration
+    from poly_classifier.stats import Stats
 
-if __name__ == "__main__":
+
+def interactive(stats=None, witness=None):
     print(
-        "Polynomial classifier for homogenous trees (currently for binary rooted & unrooted trees)"
+        "Polynomial classifier for homogenous trees (rooted & unrooted trees of any degree)"
     )
     print(
         "For unrooted case, use node configuration in form: 'A B C' and edge configurations in form 'A B'"
@@ -23,27 +35,192 @@ if __name__ == "__main__":
     )
     if ":" in line:  # rooted case
         while line != "":
-            configurations.append(
-                tuple(
-                    itertools.chain(
-                        *[x.split() for x in line.strip().split(":")])))
+            configurations.append(parse_configuration(line))
             line = input()
-        k = rooted_polynomial_classifier(configurations)
+        k = rooted_polynomial_classifier(configurations,
+                                         stats=stats,
+                                         witness=witness)
     else:  # unrooted case
         while line != "":
-            configurations.append(tuple(line.split()))
+            configurations.append(parse_configuration(line))
             line = input()
         edge_configurations = []
         line = input(
             "Edge configurations: (each configuration on a new line and end with empty line)\n"
         )
         while line != "":
-            edge_configurations.append(tuple(line.split()))
+            edge_configurations.append(parse_configuration(line))
             line = input()
-        k = unrooted_polynomial_classifier(configurations, edge_configurations)
+        k = unrooted_polynomial_classifier(configurations,
+                                           edge_configurations,
+                                           stats=stats,
+                                           witness=witness)
+    for step in witness or ():
+        subproblem = step.get("labels", step.get("configurations"))
+        if step["restriction"] is None:
+            # last step of a finite branch: nothing to recurse into
+            print(f"k = {step['k']} on {subproblem}, no flexible SCC")
+        else:
+            print(f"k = {step['k']} on {subproblem}, "
+                  f"restricted to {step['restriction']}")
     if k == 0:
         print(f"Problem Π is 'unsolvable in a strict sense'.")
     elif k == math.inf:
         print(f"Problem Π is O(log(n)) round solvable.")
     else:
         print(f"Problem Π is Θ(n^(1/{k})) round solvable.")
+    if stats is not None:
+        print(stats, file=sys.stderr)
+
+
+def serve_main(argv):
+    try:
+        from .server import serve
+    except ImportError:
+        from poly_classifier.server import serve
+    parser = argparse.ArgumentParser(
+        prog="python -m poly_classifier serve",
+        description=
+        "Serve classification requests (JSON lines, see server.py) on a Unix socket"
+    )
+    parser.add_argument("--socket",
+                        required=True,
+                        metavar="PATH",
+                        help="path of the Unix socket to listen on")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="classify in a pool of N processes (default: number of CPUs)")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="give up on a problem after SECONDS and report a timeout")
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="SQLite file with results shared with batch runs and other servers"
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        metavar="N",
+        help=
+        "stop reading requests while N classifications are in flight (default: 4 per worker)"
+    )
+    args = parser.parse_args(argv)
+    serve(args.socket,
+          workers=args.workers,
+          timeout=args.timeout,
+          result_cache=ResultCache(args.cache) if args.cache else None,
+          max_pending=args.max_pending)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["serve"]:
+        serve_main(argv[1:])
+        return
+    parser = argparse.ArgumentParser(
+        prog="python -m poly_classifier",
+        description=
+        "Polynomial classifier for homogenous trees (rooted & unrooted trees of any degree)"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help=
+        "classify every problem in a JSON lines file ('-' for stdin) and print one JSON result per line"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "text"],
+        default="json",
+        help=
+        "format of the batch file: JSON lines (default) or problems in the format of the interactive mode, separated by empty lines or '---'"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="classify batch problems in a pool of N processes")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=1,
+        metavar="N",
+        help="number of batch problems sent to a worker at once (default: 1)")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="give up on a batch problem after SECONDS and report a timeout")
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help=
+        "SQLite file with results of earlier batch runs; problems isomorphic to a cached one are not classified again"
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=
+        "report time spent in every phase and sizes of the automata (on stderr, or as \"stats\" in batch results)"
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help=
+        "show the chain of flexible SCC restrictions along a deepest branch of the recursion (as \"witness\" in batch results)"
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        metavar="SECONDS",
+        help=
+        "stop classifying a batch problem after SECONDS and report a lower bound of k"
+    )
+    parser.add_argument(
+        "--max-nodes",
+        type=int,
+        metavar="N",
+        help=
+        "stop classifying a batch problem whose automaton has more than N nodes"
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        metavar="MB",
+        help=
+        "stop classifying a batch problem once it used more than MB megabytes of memory"
+    )
+    args = parser.parse_args(argv)
+    budget = None
+    if (args.time_budget, args.max_nodes, args.max_memory) != (None, ) * 3:
+        budget = Budget(
+            args.time_budget, args.max_nodes,
+            None if args.max_memory is None else int(args.max_memory * 2**20))
+    if args.batch is None:
+        interactive(Stats() if args.stats else None,
+                    [] if args.explain else None)
+        return
+    options = dict(
+        workers=args.workers,
+        chunksize=args.chunksize,
+        timeout=args.timeout,
+        result_cache=ResultCache(args.cache) if args.cache else None,
+        collect_stats=args.stats,
+        input_format=args.format,
+        explain=args.explain,
+        budget=budget)
+    if args.batch == "-":
+        run_batch(sys.stdin, sys.stdout, **options)
+    else:
+        with open(args.batch) as input_stream:
+            run_batch(input_stream, sys.stdout, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# batch classification of problems given as JSON lines, one problem per line:
+# {"id": ..., "configurations": [[root, child_1, child_2], ...]} (rooted) or
+# {"id": ..., "configurations": [[a, b, c], ...], "edge_configurations": [[a, b], ...]} (unrooted)
+# "id" is optional and is copied to the result
+# problems in the text format of the interactive mode are read by
+# parser.read_problems and classified as Problem objects (without an id)
+import json
+import math
+import time
+from collections import namedtuple
+
+from . import parser
+from .budget import BudgetExceeded
+from .canonical import canonical_key
+from .problem import Problem
+from .rooted_poly_decider import rooted_polynomial_classifier
+from .stats import Stats
+from .unrooted_poly_decider import load_numpy, unrooted_polynomial_classifier
+
+# input that could not be read as a problem, classified as an error record
+MalformedProblem = namedtuple("MalformedProblem", ["error"])
+
+
+def read_problems(stream):
+    # yields a problem dict per line, or a MalformedProblem for a line that
+    # is not JSON, so one bad line does not abort the batch
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield MalformedProblem(f"line {number}: {error!r}")
+
+
+def read_text_problems(stream):
+    # parser.read_problems, with a MalformedProblem for a malformed problem
+    for problem in parser.read_problems(stream, skip_malformed=True):
+        if isinstance(problem, ValueError):
+            problem = MalformedProblem(str(problem))
+        yield problem
+
+
+def _result(problem):
+    # result record carrying the id of problem, if it has one
+    if isinstance(problem, dict) and "id" in problem:
+        return {"id": problem["id"]}
+    return {}
+
+
+def _check_configurations(configurations, field):
+    # configurations (the value of field) have to be a list of lists
+    if not isinstance(configurations, list) or not all(
+            isinstance(conf, list) for conf in configurations):
+        raise ValueError(f"{field} is not a list of lists")
+
+
+def to_problem(problem):
+    # Problem of a problem dict (or of a Problem)
+    if isinstance(problem, Problem):
+        return problem
+    configurations = problem["configurations"]
+    _check_configurations(configurations, "configurations")
+    edge_configurations = problem.get("edge_configurations")
+    if edge_configurations is not None:
+        _check_configurations(edge_configurations, "edge_configurations")
+    return Problem(map(tuple, configurations), edge_configurations)
+
+
+def classify(problem,
+             result_cache=None,
+             collect_stats=False,
+             explain=False,
+             budget=None):
+    # problem: problem dict or Problem
+    # output: {"id": ..., "type": "rooted"/"unrooted", "k": k, "time": seconds}
+    # result_cache: optional ResultCache; isomorphic problems are then
+    # classified only once and later hits are marked with "cached": true
+    # collect_stats: add "stats" (see stats.Stats.as_dict) to the result
+    # explain: add "witness", the subproblems along a deepest branch of the
+    # recursion (not for cached results)
+    # budget: optional budget.Budget; a problem running out of it gets
+    # "budget_exceeded" (the reason) and "k_lower_bound" instead of "k"
+    stats = Stats() if collect_stats else None
+    witness = [] if explain else None
+    interned = to_problem(problem)
+    if not interned.rooted:
+        load_numpy()  # so that "time" does not include importing it
+    start = time.perf_counter()
+    key = k = None
+    if result_cache is not None:
+        key = canonical_key(interned)  # None: too symmetric to cache
+        if key is not None:
+            k = result_cache.get(key)
+    cached = k is not None
+    if not cached:
+        if interned.rooted:
+            k = rooted_polynomial_classifier(interned,
+                                             stats=stats,
+                                             witness=witness,
+                                             budget=budget)
+        else:
+            k = unrooted_polynomial_classifier(interned,
+                                               stats=stats,
+                                               witness=witness,
+                                               budget=budget)
+        if isinstance(k, BudgetExceeded):
+            witness = None
+        elif key is not None:
+            result_cache[key] = k
+    elapsed = time.perf_counter() - start
+    result = _result(problem)
+    result["type"] = "rooted" if interned.rooted else "unrooted"
+    if isinstance(k, BudgetExceeded):
+        result.update(budget_exceeded=k.reason, k_lower_bound=k.lower_bound)
+    else:
+        result["k"] = k
+    result["time"] = elapsed
+    if cached:
+        result["cached"] = True
+    if stats is not None:
+        result["stats"] = stats.as_dict()
+    if witness is not None and not cached:
+        result["witness"] = [
+            dict(step, k="inf") if step["k"] == math.inf else step
+            for step in witness
+        ]
+    return result
+
+
+def error_record(problem, error):
+    result = _result(problem)
+    result["error"] = error
+    return result
+
+
+def classify_record(problem,
+                    result_cache=None,
+                    collect_stats=False,
+                    explain=False,
+                    budget=None):
+    # like classify, but a malformed problem yields an error record
+    if isinstance(problem, MalformedProblem):
+        return error_record(None, problem.error)
+    try:
+        return classify(problem, result_cache, collect_stats, explain, budget)
+    except (KeyError, TypeError, ValueError) as error:
+        return error_record(problem, repr(error))
+
+
+def format_result(result):
+    # JSON has no infinity, O(log n) problems are reported as "k": "inf"
+    if result.get("k") == math.inf:
+        result = dict(result, k="inf")
+    return json.dumps(result)
+
+
+def run_batch(input_stream,
+              output_stream,
+              workers=None,
+              chunksize=1,
+              timeout=None,
+              result_cache=None,
+              collect_stats=False,
+              input_format="json",
+              explain=False,
+              budget=None):
+    # workers/timeout: classify in a process pool (see parallel.classify_many)
+    # result_cache: optional ResultCache shared by all workers
+    # collect_stats: add per-phase statistics to every result
+    # explain: add the witness of the result to every result
+    # budget: optional budget.Budget of every problem
+    # input_format: "json" (JSON lines) or "text" (see parser.py)
+    if input_format == "text":
+        problems = read_text_problems(input_stream)
+    else:
+        problems = read_problems(input_stream)
+    if workers is None and timeout is None:
+        results = (classify_record(problem, result_cache, collect_stats,
+                                   explain, budget) for problem in problems)
+    else:
+        from .parallel import classify_many
+        results = classify_many(problems,
+                                workers=workers,
+                                chunksize=chunksize,
+                                timeout=timeout,
+                                result_cache=result_cache,
+                                collect_stats=collect_stats,
+                                explain=explain,
+                                budget=budget)
+    for result in results:
+        output_stream.write(format_result(result) + "\n")
+        output_stream.flush()
@@ -0,0 +1,69 @@
+# opt-in parallel exploration of sibling branches of the max_depth recursion
+# (concurrent.futures and multiprocessing are imported only once a pool is
+# created, classification without workers never needs them)
+import math
+
+_cancelled = None  # set inside branch workers, see BranchPool
+
+
+class BranchCancelled(Exception):
+    pass
+
+
+def _init_worker(cancelled):
+    global _cancelled
+    _cancelled = cancelled
+
+
+def check_cancelled():
+    # called by max_depth between branches; a no-op outside of branch workers
+    if _cancelled is not None and _cancelled.is_set():
+        raise BranchCancelled()
+
+
+class BranchPool:
+    # process pool for one classification call, used as a context manager
+
+    def __init__(self, workers=None):
+        import concurrent.futures
+        import multiprocessing
+        self._cancelled = multiprocessing.Event()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(self._cancelled, ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def max(self, function, arguments):
+        # maximum of function(*args) over arguments, evaluated in parallel
+        # as soon as some branch is math.inf the other branches are cancelled
+        import concurrent.futures
+        futures = [
+            self._executor.submit(function, *args) for args in arguments
+        ]
+        maximum = 0
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                maximum = max(maximum, future.result())
+                if maximum == math.inf:
+                    self._cancelled.set()
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+        return maximum
+
+
+def branch_frame(children, key, pool, max_depth, *args):
+    # frame of the max_depth recursion (see recursion.py) evaluating the
+    # distinct children of a subproblem as max_depth(child, *args) in pool
+    # key(child): memo key identifying equal children
+    children = {key(child): child for child in children}
+    if len(children) == 1:  # nothing to split yet, descend
+        [child] = children.values()
+        return 1 + (yield child)
+    return 1 + pool.max(max_depth, [(child, ) + args
+                                    for child in children.values()])
@@ -0,0 +1,109 @@
+# opt-in time, automaton size and memory budgets of one classification
+# pass budget=Budget(...) to rooted_polynomial_classifier or
+# unrooted_polynomial_classifier; the hot loops call check_budget, which is a
+# no-op unless a budget is active, and a classification running out of its
+# budget returns BudgetExceeded instead of k (see within_budget)
+import math
+import os
+import sys
+import time
+from collections import namedtuple
+
+# reason: "time", "nodes" or "memory"
+# lower_bound: k is at least this (0 if nothing is known yet)
+BudgetExceeded = namedtuple("BudgetExceeded", ["reason", "lower_bound"])
+
+_active = None  # Budget of the running classification
+
+
+class OutOfBudget(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+        self.lower_bound = 0
+
+
+def _resident_memory():
+    # resident set size of this process in bytes, the peak one where
+    # /proc/self/statm is missing
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def partial_depth(deepest):
+    # lower bound of the depth of nested subproblems being evaluated, from
+    # the deepest finished child of each of them (outermost first): every
+    # subproblem is one deeper than each of its children, and at least 1
+    bound = 0
+    for depth in reversed(deepest):
+        bound = 1 + max(depth, bound)
+    return bound
+
+
+class Budget:
+    # seconds: wall time of the classification
+    # nodes: largest automaton (labels or path configurations) to build
+    # memory: bytes the resident memory of the process may grow by
+    # used as a context manager by the classifiers, which activates it; a
+    # budget can be reused, every classification gets all of it
+
+    def __init__(self, seconds=None, nodes=None, memory=None):
+        self.seconds = seconds
+        self.nodes = nodes
+        self.memory = memory
+        self._deadline = self._baseline = None
+        self._checks = 0
+        self._previous = None
+
+    def __enter__(self):
+        global _active
+        if self.seconds is not None:
+            self._deadline = time.perf_counter() + self.seconds
+        if self.memory is not None:
+            self._baseline = _resident_memory()
+        self._checks = 0
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+
+    def check(self, nodes=None, allocate=None):
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise OutOfBudget("time")
+        if nodes is not None and self.nodes is not None and nodes > self.nodes:
+            raise OutOfBudget("nodes")
+        if allocate is not None and self.memory is not None:
+            if _resident_memory() - self._baseline + allocate > self.memory:
+                raise OutOfBudget("memory")
+        self._checks += 1
+        # reading the memory usage is a system call, so it is polled less
+        # often
+        if self.memory is not None and self._checks % 256 == 0:
+            if _resident_memory() - self._baseline > self.memory:
+                raise OutOfBudget("memory")
+
+
+def check_budget(nodes=None, allocate=None):
+    # called in the hot loops; nodes: size of an automaton about to be used
+    # allocate: bytes about to be allocated at once
+    if _active is not None:
+        _active.check(nodes, allocate)
+
+
+def within_budget(budget, classifier, *args):
+    # classifier(*args) with budget active: its k, or BudgetExceeded once the
+    # budget is used up
+    with budget:
+        try:
+            return classifier(*args)
+        except OutOfBudget as error:
+            if error.lower_bound == math.inf:  # k is known after all
+                return math.inf
+            return BudgetExceeded(error.reason, error.lower_bound)
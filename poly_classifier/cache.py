@@ -0,0 +1,107 @@
+import math
+from collections import OrderedDict
+
+
+class LRUCache:
+    # bounded cache of max_depth results that persists across classifier calls
+    # pass it as `cache=` to rooted_polynomial_classifier/unrooted_polynomial_classifier
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def prune(self, stale):
+        # drop every entry whose key satisfies stale
+        for key in [key for key in self._data if stale(key)]:
+            del self._data[key]
+
+    def scoped(self, prefix):
+        # view of the cache in which every key is paired with `prefix`
+        return _ScopedCache(self, prefix)
+
+
+class _ScopedCache:
+    def __init__(self, cache, prefix):
+        self._cache = cache
+        self._prefix = prefix
+
+    def get(self, key, default=None):
+        return self._cache.get((self._prefix, key), default)
+
+    def __setitem__(self, key, value):
+        self._cache[(self._prefix, key)] = value
+
+
+def get_memo(cache, prefix):
+    # per-call memo table, optionally backed by a persistent LRUCache
+    if cache is None:
+        return {}
+    return cache.scoped(prefix)
+
+
+class ResultCache:
+    # persistent classification results keyed by canonical.canonical_key
+    # stored in SQLite, so one file can be shared by several processes;
+    # each process opens its own connection (also after unpickling)
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _connect(self):
+        if self._connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path,
+                                         timeout=60,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS results "
+                               "(key TEXT PRIMARY KEY, k TEXT NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+    def get(self, key, default=None):
+        row = self._connect().execute("SELECT k FROM results WHERE key = ?",
+                                      (key, )).fetchone()
+        if row is None:
+            return default
+        return math.inf if row[0] == "inf" else int(row[0])
+
+    def __setitem__(self, key, k):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO results (key, k) VALUES (?, ?)",
+            (key, "inf" if k == math.inf else str(k)))
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,302 @@
+# canonical forms of problems up to relabeling (and, for rooted problems, up
+# to the order of the children), used as keys of the persistent ResultCache
+#
+# labels are colored by iterated refinement of their incidences, where only
+# the configurations of labels whose color changed are recolored, and ties
+# are broken by individualizing a label and refining again; the canonical
+# form is the smallest relabeled encoding over all leaves of that search.
+# A leaf with the encoding of the first or the best leaf yields an
+# automorphism: the search then returns to their common ancestor, and the
+# children of a node in one orbit of the automorphisms fixing its
+# individualized labels have equivalent subtrees, so only one is searched.
+# A tied cell of labels that are pairwise interchangeable (swapping two of
+# them maps the problem to itself) is a single orbit, so only one of its
+# labels is individualized.
+# The search stops once the refinement work exceeds max_work times the size
+# of the problem, which bounds the cost of a key next to the classification;
+# very symmetric problems get no key (None) and are not cached
+import hashlib
+import itertools
+
+from .problem import Problem
+
+
+def _normalize(problem):
+    # problem -> (rooted, number of labels, configurations, edge
+    # configurations), duplicates removed and labels renumbered so that only
+    # labels of node configurations remain
+    # children of a rooted configuration and labels of a node configuration
+    # form multisets (see Problem.multisets)
+    configurations = problem.multisets()
+    labels = set(itertools.chain.from_iterable(configurations))
+    # edge configurations with a label outside the node configurations
+    # never influence the classification
+    edge_configurations = [
+        edge_conf for edge_conf in problem.edge_configurations()
+        if edge_conf[0] in labels and edge_conf[1] in labels
+    ]
+    if len(labels) < len(problem.labels):
+        # renumbering in increasing order keeps the multisets sorted
+        renumber = {label: i for i, label in enumerate(sorted(labels))}
+        configurations = [
+            tuple(renumber[label] for label in conf)
+            for conf in configurations
+        ]
+        edge_configurations = [
+            tuple(renumber[label] for label in edge_conf)
+            for edge_conf in edge_configurations
+        ]
+    edge_configurations = {
+        tuple(sorted(edge_conf))
+        for edge_conf in edge_configurations
+    }
+    return (problem.rooted, len(labels), sorted(configurations),
+            sorted(edge_configurations))
+
+
+def _conf_colors(rooted, conf, colors):
+    if rooted:
+        return (colors[conf[0]], ) + tuple(
+            sorted(colors[label] for label in conf[1:]))
+    return tuple(sorted(colors[label] for label in conf))
+
+
+class _Refiner:
+    # color refinement until the colors are stable; colors are 0..c-1 for c
+    # colors and keys[i] is the colored configuration i (the configurations
+    # followed by the edge configurations)
+    # only the configurations at labels whose color changed are recolored:
+    # labels of one color have the same colored incidences, so they keep
+    # having the same ones if their incidences at those configurations
+    # changed in the same way, and only these changes are compared (labels
+    # with the same incidences but different changes are split too, which
+    # does not depend on the labeling either)
+    # a color that splits keeps the part with the smallest change and the
+    # other parts get the next colors, in the order of the colors and of the
+    # changes, so colors stay canonical
+    # work counts the incidences looked at, refine returns None once it
+    # exceeds max_work
+
+    def __init__(self, rooted, configurations, edge_configurations, n,
+                 max_work):
+        self.rooted = rooted
+        self.configurations = configurations + edge_configurations
+        self.edges = len(configurations)  # first edge configuration
+        # roles[i][position]: role of the label at position of configuration i
+        self.roles = [(1, ) + (0, ) * (len(conf) - 1) if rooted else
+                      (0, ) * len(conf) for conf in configurations]
+        self.roles += [(2, 2)] * len(edge_configurations)
+        # incidences[label]: the configurations containing label
+        self.incidences = [[] for _ in range(n)]
+        for index, conf in enumerate(self.configurations):
+            for label in set(conf):
+                self.incidences[label].append(index)
+        self.members = [set(configurations), set(edge_configurations)]
+        self.work = 0
+        self.max_work = max_work
+
+    def _key(self, index, colors):
+        conf = self.configurations[index]
+        if index >= self.edges:
+            return tuple(sorted(colors[label] for label in conf))
+        return _conf_colors(self.rooted, conf, colors)
+
+    def initial(self):
+        # stable (colors, keys) from a single color, or None
+        n = len(self.incidences)
+        return self.refine([0] * n, [()] * len(self.configurations),
+                           set(range(n)))
+
+    def refine(self, colors, keys, changed):
+        # colors and keys stable except at the labels changed (which have
+        # colors of their own); output: stable (colors, keys), or None
+        colors = list(colors)
+        keys = list(keys)
+        cells = {}
+        for label, color in enumerate(colors):
+            cells.setdefault(color, []).append(label)
+        while changed:
+            touched = {
+                index
+                for label in changed for index in self.incidences[label]
+            }
+            # changes of the colored incidences of every label at touched
+            changes = {}
+            for index in touched:
+                old = keys[index]
+                new = keys[index] = self._key(index, colors)
+                self.work += len(self.configurations[index])
+                if new == old:
+                    continue
+                for label, role in zip(self.configurations[index],
+                                       self.roles[index]):
+                    change = changes.get(label)
+                    if change is None:
+                        change = changes[label] = []
+                    change.append((role, new, old))
+            if self.work > self.max_work:
+                return None
+            by_color = {}
+            for label in changes:
+                by_color.setdefault(colors[label], []).append(label)
+            changed = set()
+            for color in sorted(by_color):
+                cell = cells[color]
+                if len(cell) == 1:
+                    continue
+                parts = {}
+                for label in by_color[color]:
+                    signature = tuple(sorted(changes[label]))
+                    parts.setdefault(signature, []).append(label)
+                if len(by_color[color]) < len(cell):
+                    parts.setdefault((), []).extend(
+                        label for label in cell if label not in changes)
+                if len(parts) == 1:
+                    continue
+                signatures = sorted(parts)
+                cells[color] = parts[signatures[0]]
+                for signature in signatures[1:]:
+                    new_color = len(cells)
+                    cells[new_color] = parts[signature]
+                    for label in parts[signature]:
+                        colors[label] = new_color
+                    changed.update(parts[signature])
+        return colors, keys
+
+    def twins(self, u, v):
+        # whether exchanging labels u and v is an automorphism
+        swap = {u: v, v: u}
+        for index in set(self.incidences[u] + self.incidences[v]):
+            image = [swap.get(label, label) for label in self.configurations[index]]
+            if index >= self.edges or not self.rooted:
+                image = tuple(sorted(image))
+            else:
+                image = (image[0], ) + tuple(sorted(image[1:]))
+            self.work += len(image)
+            if image not in self.members[index >= self.edges]:
+                return False
+        return True
+
+    def encode(self, keys):
+        # the problem relabeled by the colors of keys
+        return (self.rooted, tuple(sorted(keys[:self.edges])),
+                tuple(sorted(keys[self.edges:])))
+
+
+def _find(parent, label):
+    while parent[label] != label:
+        parent[label] = label = parent[parent[label]]
+    return label
+
+
+def _join_orbits(orbits, automorphisms, fixed):
+    # orbits = [union-find parent of the labels of a tied cell, number of
+    # automorphisms joined]; joins the orbits of the new automorphisms
+    # (permutations of labels, as lists) that fix every label of fixed
+    parent, joined = orbits
+    for automorphism in automorphisms[joined:]:
+        if all(automorphism[label] == label for label in fixed):
+            for label in parent:
+                image = automorphism[label]
+                if image in parent:
+                    parent[_find(parent, image)] = _find(parent, label)
+    orbits[1] = len(automorphisms)
+
+
+def canonical_form(configurations, edge_configurations=None, max_work=64):
+    # configurations/edge_configurations as for the classifiers (a Problem
+    # may be passed instead); edge_configurations None means rooted
+    # output: the canonical form, or None if the search needs more than
+    # max_work times the size of the problem in refinement work
+    if isinstance(configurations, Problem):
+        problem = configurations
+    else:
+        problem = Problem(configurations, edge_configurations)
+    rooted, n, configurations, edge_configurations = _normalize(problem)
+    size = sum(map(len, configurations)) + 2 * len(edge_configurations)
+    refiner = _Refiner(rooted, configurations, edge_configurations, n,
+                       max_work * max(size, 1))
+    # the first leaf and the best one, as (encoding, colors, path)
+    first = best = None
+    automorphisms = []
+    # depth-first search; the frame of every node on the current path is
+    # (colors, keys of the configurations, individualized labels, tied cell,
+    # explored labels of the cell, orbits of the cell)
+    stack = []
+    refined = refiner.initial()
+    if refined is None:
+        return None
+    (colors, keys), path = refined, ()
+    while True:
+        cells = {}
+        for label, color in enumerate(colors):
+            cells.setdefault(color, []).append(label)
+        ties = [cell for cell in cells.values() if len(cell) > 1]
+        if ties:
+            # individualize the labels of the smallest tied cell in turn;
+            # if all of them are twins of its first label, every permutation
+            # of the cell is an automorphism and they form a single orbit
+            cell = min(ties, key=lambda cell: (len(cell), colors[cell[0]]))
+            if all(refiner.twins(cell[0], label) for label in cell[1:]):
+                parent = dict.fromkeys(cell, cell[0])
+            else:
+                parent = {label: label for label in cell}
+            if refiner.work > refiner.max_work:
+                return None
+            stack.append(
+                (colors, keys, path, cell, [], [parent, len(automorphisms)]))
+        else:
+            leaf = (refiner.encode(keys), colors, path)
+            if first is None:
+                first = best = leaf
+            elif leaf[0] < best[0]:
+                best = leaf
+            else:
+                for other in (first, best):
+                    if leaf[0] == other[0]:
+                        # relabeling this leaf as the other one is an
+                        # automorphism, which maps the subtree below their
+                        # common ancestor onto an explored one
+                        label_of = {
+                            color: label
+                            for label, color in enumerate(other[1])
+                        }
+                        automorphisms.append(
+                            [label_of[color] for color in colors])
+                        common = 0
+                        while path[common] == other[2][common]:
+                            common += 1
+                        del stack[common + 1:]
+                        break
+        # next child: a label in no orbit of an explored one under the
+        # automorphisms fixing the path, as their subtrees are images of
+        # each other and give the same encodings
+        while stack:
+            colors, keys, path, cell, explored, orbits = stack[-1]
+            _join_orbits(orbits, automorphisms, path)
+            seen = {_find(orbits[0], label) for label in explored}
+            label = next((label for label in cell if label not in explored
+                          and _find(orbits[0], label) not in seen), None)
+            if label is not None:
+                break
+            stack.pop()
+        else:
+            return best[0]
+        explored.append(label)
+        individualized = list(colors)
+        individualized[label] = max(colors) + 1  # colors are 0..c-1
+        refined = refiner.refine(individualized, keys, {label})
+        if refined is None:
+            return None
+        colors, keys = refined
+        path += (label, )
+
+
+def canonical_key(configurations, edge_configurations=None, max_work=64):
+    # short, process-independent digest of canonical_form, None for
+    # problems too symmetric to key within max_work times their size in
+    # refinement work (they are then not cached)
+    form = canonical_form(configurations, edge_configurations, max_work)
+    if form is None:
+        return None
+    return hashlib.sha256(repr(form).encode()).hexdigest()
@@ -0,0 +1,297 @@
+# graph = {node: [successor_1, successor_2, ...], ...} (dict-of-lists digraph)
+# CSRGraph(nodes, indptr, indices): node i is nodes[i] and its successors are
+# indices[indptr[i]:indptr[i + 1]] (compressed sparse row digraph)
+import math
+from collections import namedtuple
+
+from .budget import check_budget
+
+CSRGraph = namedtuple("CSRGraph", ["nodes", "indptr", "indices"])
+
+
+def _as_list(array):
+    if isinstance(array, list):
+        return array
+    return array.tolist() if hasattr(array, "tolist") else list(array)
+
+
+def from_dict(graph):
+    nodes = list(graph)
+    position = {node: i for i, node in enumerate(nodes)}
+    indptr = [0]
+    indices = []
+    for node in nodes:
+        indices.extend(position[succ] for succ in graph[node])
+        indptr.append(len(indices))
+    return CSRGraph(nodes, indptr, indices)
+
+
+def to_dict(csr):
+    nodes = csr.nodes
+    indptr = _as_list(csr.indptr)
+    indices = _as_list(csr.indices)
+    return {
+        node: [nodes[j] for j in indices[indptr[i]:indptr[i + 1]]]
+        for i, node in enumerate(nodes)
+    }
+
+
+def induced_subgraph(indptr, indices, subset):
+    # (indptr, indices) of the subgraph induced by the list of node ids
+    # subset, its node i being subset[i]; only edges leaving subset nodes are
+    # scanned, so this costs O(subset and its edges), not O(V)
+    indptr = _as_list(indptr)
+    indices = _as_list(indices)
+    local = {node: i for i, node in enumerate(subset)}
+    sub_indptr = [0]
+    sub_indices = []
+    for node in subset:
+        check_budget()
+        sub_indices.extend([
+            local[succ] for succ in indices[indptr[node]:indptr[node + 1]]
+            if succ in local
+        ])
+        sub_indptr.append(len(sub_indices))
+    return sub_indptr, sub_indices
+
+
+def csr_strongly_connected_components(indptr, indices):
+    # iterative Tarjan's algorithm, O(V + E) without recursion
+    # output: list of components, each a list of node ids
+    indptr = _as_list(indptr)
+    indices = _as_list(indices)
+    n = len(indptr) - 1
+    index = [-1] * n
+    lowlink = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        check_budget()
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, indptr[root])]
+        while work:
+            node, position = work[-1]
+            end = indptr[node + 1]
+            while position < end:
+                succ = indices[position]
+                position += 1
+                if index[succ] == -1:
+                    break
+                if on_stack[succ] and index[succ] < lowlink[node]:
+                    lowlink[node] = index[succ]
+            else:
+                succ = -1
+            if succ != -1 and index[succ] == -1:
+                check_budget()
+                work[-1] = (node, position)
+                index[succ] = lowlink[succ] = counter
+                counter += 1
+                stack.append(succ)
+                on_stack[succ] = True
+                work.append((succ, indptr[succ]))
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if lowlink[node] < lowlink[parent]:
+                    lowlink[parent] = lowlink[node]
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+def strongly_connected_components(graph):
+    csr = from_dict(graph)
+    return [{csr.nodes[i]
+             for i in component}
+            for component in csr_strongly_connected_components(
+                csr.indptr, csr.indices)]
+
+
+def induced_size(indptr, indices):
+    # (nodes, edges) of the graph
+    return len(indptr) - 1, len(indices)
+
+
+def is_cyclic_component(indptr, indices, component):
+    # a component carries a cycle iff it has more than one node or a self-loop
+    if len(component) > 1:
+        return True
+    node = component[0]
+    return node in indices[indptr[node]:indptr[node + 1]]
+
+
+def component_periods(indptr, indices, components):
+    # period (gcd of cycle lengths) of every strongly connected component,
+    # from BFS levels: the gcd of level[u] + 1 - level[v] over the edges u -> v
+    # inside the component; 0 means the component has no cycle
+    # a component is flexible iff its period is 1
+    indptr = _as_list(indptr)
+    indices = _as_list(indices)
+    n = len(indptr) - 1
+    owner = [-1] * n
+    for component_id, component in enumerate(components):
+        for node in component:
+            owner[node] = component_id
+    level = [-1] * n
+    periods = []
+    for component_id, component in enumerate(components):
+        check_budget()
+        period = 0
+        root = component[0]
+        level[root] = 0
+        queue = [root]
+        for node in queue:
+            next_level = level[node] + 1
+            for succ in indices[indptr[node]:indptr[node + 1]]:
+                if owner[succ] != component_id:
+                    continue
+                if level[succ] == -1:
+                    level[succ] = next_level
+                    queue.append(succ)
+                else:
+                    period = math.gcd(period, next_level - level[succ])
+        periods.append(period)
+    return periods
+
+
+class IncrementalComponents:
+    # strongly connected components and their periods of a digraph that only
+    # grows; nodes are ints, added with add_node and add_edge
+    # insertions never split a component, they merge the components on a
+    # new cycle, which has to pass through a new edge between components, so
+    # only the condensation reachable from such edges is searched again
+    # every node keeps a level, the length of some walk to it from a fixed
+    # node of its component, so the period of a component is the gcd of
+    # level[u] + 1 - level[v] over its edges u -> v (see component_periods)
+    # and an edge inside a component updates it in O(1)
+
+    def __init__(self):
+        self.successors = {}
+        self.predecessors = {}
+        self._parent = {
+        }  # union-find forest, a component is named by its root
+        self._members = {}  # root -> nodes of its component
+        self._period = {}
+        self._out = {}  # root -> components entered by its edges (maybe stale)
+        self._level = {}
+        self._heads = set(
+        )  # components entered by new edges between components
+
+    def __contains__(self, node):
+        return node in self._parent
+
+    def add_node(self, node):
+        self.successors[node] = []
+        self.predecessors[node] = []
+        self._parent[node] = node
+        self._members[node] = [node]
+        self._period[node] = 0
+        self._out[node] = set()
+        self._level[node] = 0
+
+    def add_edge(self, u, v):
+        self.successors[u].append(v)
+        self.predecessors[v].append(u)
+        root_u, root_v = self._find(u), self._find(v)
+        if root_u == root_v:
+            self._period[root_u] = math.gcd(
+                self._period[root_u], self._level[u] + 1 - self._level[v])
+        else:
+            self._out[root_u].add(root_v)
+            self._heads.add(root_v)
+
+    def components(self):
+        # list of (nodes, period) of every component
+        self._merge_cycles()
+        return [(self._members[root], self._period[root])
+                for root in self._members]
+
+    def _find(self, node):
+        root = node
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[node] != root:
+            self._parent[node], node = root, self._parent[node]
+        return root
+
+    def _merge_cycles(self):
+        # condensation reachable from the new edges, as a CSR graph
+        roots = list({self._find(head) for head in self._heads})
+        self._heads.clear()
+        position = {root: i for i, root in enumerate(roots)}
+        indptr = [0]
+        indices = []
+        for root in roots:  # grows while it is scanned
+            out = self._out[root] = {
+                self._find(succ)
+                for succ in self._out[root]
+            } - {root}
+            for succ in out:
+                if succ not in position:
+                    position[succ] = len(roots)
+                    roots.append(succ)
+                indices.append(position[succ])
+            indptr.append(len(indices))
+        for component in csr_strongly_connected_components(indptr, indices):
+            if len(component) > 1:
+                self._merge([roots[i] for i in component])
+
+    def _merge(self, roots):
+        # roots: components on a common cycle; the largest of them keeps its
+        # levels, the nodes of the others are leveled from it
+        base = max(roots, key=lambda root: len(self._members[root]))
+        inside = set(roots)
+        moved = [
+            node for root in roots if root != base
+            for node in self._members[root]
+        ]
+        moved_set = set(moved)
+        level = self._level
+        leveled = set()
+        queue = []
+        for node in moved:
+            for pred in self.predecessors[node]:
+                if self._find(pred) == base:
+                    level[node] = level[pred] + 1
+                    leveled.add(node)
+                    queue.append(node)
+                    break
+        for node in queue:  # every moved node is reachable from base
+            for succ in self.successors[node]:
+                if succ in moved_set and succ not in leveled:
+                    level[succ] = level[node] + 1
+                    leveled.add(succ)
+                    queue.append(succ)
+        # edges inside base are already accounted for in its period
+        period = self._period[base]
+        for node in moved:
+            for succ in self.successors[node]:
+                if self._find(succ) in inside:
+                    period = math.gcd(period, level[node] + 1 - level[succ])
+            for pred in self.predecessors[node]:
+                if self._find(pred) == base:
+                    period = math.gcd(period, level[pred] + 1 - level[node])
+        for root in roots:
+            if root != base:
+                self._parent[root] = base
+                self._members[base].extend(self._members.pop(root))
+                self._out[base] |= self._out.pop(root)
+                del self._period[root]
+        self._period[base] = period
+        self._out[base] = {self._find(succ)
+                           for succ in self._out[base]} - {base}
@@ -0,0 +1,339 @@
+# classifiers for problems that grow one configuration at a time
+# adding configurations (or edge configurations) can only enlarge the trimmed
+# label set, so each update only re-examines the labels that were trimmed
+# away before; the automaton of all configurations only gains nodes and
+# edges, and the components of its top-level subgraph (the one induced by the
+# trimmed problem) are kept up to date by digraph.IncrementalComponents, so
+# complexity() does not search the top level again
+# max_depth results of subproblems that a new configuration cannot influence
+# are kept in a bounded memo table, the automaton is shared with them
+# labels are interned with problem.Problem, as in the one-shot classifiers
+import itertools
+import math
+
+from . import rooted_poly_decider as rooted
+from . import unrooted_poly_decider as unrooted
+from .cache import LRUCache
+from .digraph import CSRGraph, IncrementalComponents
+from .problem import Problem
+
+
+def _csr(nodes, successors):
+    # CSRGraph of the adjacency lists successors[i] of nodes[i]
+    indptr = [0]
+    indptr.extend(itertools.accumulate(map(len, successors)))
+    return CSRGraph(nodes, indptr,
+                    list(itertools.chain.from_iterable(successors)))
+
+
+def _children_depth(children, depth):
+    # 1 + maximum of depth(child) over the children, math.inf as soon as a
+    # restriction keeps everything (child None)
+    maximum = 0
+    for child in children:
+        if child is None:
+            return math.inf
+        maximum = max(maximum, depth(child))
+    return 1 + maximum
+
+
+class IncrementalRootedClassifier:
+    # memo_size: number of subproblem results kept between calls
+    def __init__(self, configurations=(), memo_size=4096):
+        self.configurations = []
+        self.problem = Problem()
+        self._configurations = []  # interned configurations
+        self._known = set()
+        self._by_head = {}  # label -> configurations with that root
+        self._labels = set()
+        self._trimmed = set()
+        # automaton of all labels: label -> children and label -> parents
+        self._successors = []
+        self._predecessors = []
+        self._top = IncrementalComponents()  # ... induced by self._trimmed
+        self._automaton = None
+        self._memo = LRUCache(memo_size)
+        self._depth = None
+        for conf in configurations:
+            self.add_configuration(conf)
+
+    def add_configuration(self, conf):
+        conf = tuple(conf)
+        row = self.problem.add_configuration(conf)  # validates conf
+        self.configurations.append(conf)
+        conf = row
+        conf = (conf[0], ) + tuple(sorted(conf[1:]))
+        if conf in self._known:
+            return
+        self._known.add(conf)
+        self._configurations.append(conf)
+        self._by_head.setdefault(conf[0], []).append(conf)
+        self._labels.update(conf)
+        while len(self._successors) < len(self.problem.labels):
+            self._successors.append([])
+            self._predecessors.append([])
+        head = conf[0]
+        for tail in set(conf[1:]):
+            if tail not in self._successors[head]:
+                self._successors[head].append(tail)
+                self._predecessors[tail].append(head)
+                if head in self._top and tail in self._top:
+                    self._top.add_edge(head, tail)
+        # max_depth(labels) only reads configurations whose root is in labels
+        # (memo keys are bitsets of labels)
+        self._memo.prune(lambda key: key >> head & 1)
+        trimmed = self._grow_trimmed()
+        added = trimmed - self._trimmed
+        self._trimmed = trimmed
+        for label in added:
+            self._top.add_node(label)
+        for label in added:
+            for succ in self._successors[label]:
+                if succ in self._top:
+                    self._top.add_edge(label, succ)
+            for pred in self._predecessors[label]:
+                if pred in self._top and pred not in added:
+                    self._top.add_edge(pred, label)
+        self._automaton = None
+        self._depth = None
+
+    def _grow_trimmed(self):
+        # every label of the old trimmed set survives, the rest is trimmed
+        # again as in rooted_poly_decider.trim
+        kept = self._trimmed
+        labels = set(self._labels)
+        while True:
+            candidates = [
+                conf for label in labels - kept
+                for conf in self._by_head.get(label, ())
+            ]
+            new_labels = kept | rooted.get_new_labels(labels, candidates)
+            if new_labels == labels:
+                return labels
+            labels = new_labels
+
+    def complexity(self):
+        if self._depth is None:
+            self._depth = _children_depth(
+                self._children(), self._max_depth) if self._trimmed else 0
+        return self._depth
+
+    def _children(self):
+        # trimmed flexible restrictions of the top level (None if one of
+        # them keeps every label)
+        for nodes, period in self._top.components():
+            if period == 1:
+                if len(nodes) == len(self._trimmed):
+                    yield None
+                    return
+                yield rooted.trim(set(nodes), self._configurations)
+
+    def _max_depth(self, labels):
+        if self._automaton is None:
+            labels_count = len(self._successors)
+            self._automaton = (_csr(list(range(labels_count)),
+                                    self._successors),
+                               list(range(labels_count)))
+        return rooted.max_depth(labels,
+                                self._configurations,
+                                self._memo,
+                                automaton=self._automaton)
+
+
+class IncrementalUnrootedClassifier:
+    # memo_size: number of subproblem results kept between calls
+    def __init__(self,
+                 configurations=(),
+                 edge_configurations=(),
+                 memo_size=4096):
+        self.configurations = []
+        self.edge_configurations = []
+        self.problem = Problem(edge_configurations=[])
+        self._configurations = []  # interned configurations
+        self._compatibility = {}
+        self._containing = {}  # label -> configurations containing it
+        self._labels = set()
+        self._trimmed_labels = set()
+        self._valid = set()  # labels with a partner in self._trimmed_labels
+        self._trimmed = []
+        self._trimmed_set = set()
+        # automaton of the path configurations of all configurations
+        self._nodes = []
+        self._position = {}
+        self._path_positions = {}  # configuration -> its positions
+        self._successors = []
+        self._predecessors = []
+        self._by_first = {}  # label -> positions of (label, _)
+        self._by_second = {}  # label -> positions of (_, label)
+        self._top = IncrementalComponents()  # ... induced by self._trimmed
+        self._automaton = None
+        self._memo = LRUCache(memo_size)
+        self._depth = None
+        for edge_conf in edge_configurations:
+            self.add_edge_configuration(edge_conf)
+        for conf in configurations:
+            self.add_configuration(conf)
+
+    def add_configuration(self, conf):
+        # memo keys are configuration sets, so no subproblem is affected
+        conf = tuple(conf)
+        row = self.problem.add_configuration(conf)  # validates conf
+        self.configurations.append(conf)
+        conf = tuple(sorted(row))
+        if conf in self._path_positions:
+            return
+        self._configurations.append(conf)
+        for label in set(conf):
+            self._containing.setdefault(label, []).append(conf)
+        self._labels.update(conf)
+        positions = []
+        for path_conf in unrooted.get_path_configurations(conf):
+            position = self._position.get(path_conf)
+            if position is None:
+                position = self._add_node(path_conf)
+            positions.append(position)
+        self._path_positions[conf] = tuple(positions)
+        self._update(set(conf), [conf])
+
+    def _add_node(self, path_conf):
+        # s -> t iff compatible[s[1], t[0]]
+        position = self._position[path_conf] = len(self._nodes)
+        self._nodes.append(path_conf)
+        self._successors.append([])
+        self._predecessors.append([])
+        first, second = path_conf
+        self._by_first.setdefault(first, []).append(position)
+        self._by_second.setdefault(second, []).append(position)
+        for partner in self._compatibility.get(second, ()):
+            for succ in self._by_first.get(partner, ()):
+                self._add_edge(position, succ)
+        for partner in self._compatibility.get(first, ()):
+            for pred in self._by_second.get(partner, ()):
+                if pred != position:  # a self-loop was added above
+                    self._add_edge(pred, position)
+        return position
+
+    def _add_edge(self, u, v):
+        self._successors[u].append(v)
+        self._predecessors[v].append(u)
+        if u in self._top and v in self._top:
+            self._top.add_edge(u, v)
+
+    def add_edge_configuration(self, edge_conf):
+        edge_conf = tuple(edge_conf)
+        a, b = self.problem.add_edge_configuration(edge_conf)
+        self.edge_configurations.append(edge_conf)
+        if b in self._compatibility.get(a, ()):
+            return
+        self._compatibility.setdefault(a, set()).add(b)
+        self._compatibility.setdefault(b, set()).add(a)
+        for first, second in {(a, b), (b, a)}:
+            for u in self._by_second.get(first, ()):
+                for v in self._by_first.get(second, ()):
+                    self._add_edge(u, v)
+        # max_depth(configurations) only reads compatibility among their labels
+        self._memo.prune(lambda key: {a, b} <= unrooted.get_labels(key))
+        self._update({a, b}, [])
+
+    def _update(self, touched, new_configurations):
+        # touched: labels that may have gained a partner
+        # new_configurations: configurations not examined before
+        # every label of the old trimmed set survives, the rest is trimmed
+        # again as in unrooted_poly_decider.trim
+        kept = self._trimmed_labels
+        labels = set(self._labels)
+        while True:
+            candidates = {
+                conf
+                for label in labels - kept
+                for conf in self._containing.get(label, ())
+            }
+            new_labels = kept | unrooted.get_new_labels(
+                candidates, self._compatibility, labels)
+            if new_labels == labels:
+                break
+            labels = new_labels
+        touched = set(touched)
+        for label in labels - kept:
+            touched |= self._compatibility.get(label, set())
+        self._trimmed_labels = labels
+        # trimmed configurations are those with only valid labels; neither
+        # set ever shrinks, so only configurations of new valid labels and
+        # new configurations can join
+        valid = {
+            label
+            for label in touched - self._valid
+            if unrooted.has_partner(self._compatibility, label, labels)
+        }
+        self._valid |= valid
+        candidates = list(new_configurations)
+        candidates.extend(conf for label in valid
+                          for conf in self._containing.get(label, ()))
+        joined = [
+            conf for conf in dict.fromkeys(candidates)
+            if conf not in self._trimmed_set and self._valid.issuperset(conf)
+        ]
+        self._trimmed.extend(joined)
+        self._trimmed_set.update(joined)
+        # their path configurations join the top-level subgraph
+        added = {
+            self._position[path_conf]
+            for conf in joined
+            for path_conf in unrooted.get_path_configurations(conf)
+        }
+        added = [position for position in added if position not in self._top]
+        for position in added:
+            self._top.add_node(position)
+        for position in added:
+            for succ in self._successors[position]:
+                if succ in self._top:
+                    self._top.add_edge(position, succ)
+        added = set(added)
+        for position in added:
+            for pred in self._predecessors[position]:
+                if pred in self._top and pred not in added:
+                    self._top.add_edge(pred, position)
+        self._automaton = None
+        self._depth = None
+
+    def complexity(self):
+        if self._depth is None:
+            self._depth = _children_depth(
+                self._children(), self._max_depth) if self._trimmed else 0
+        return self._depth
+
+    def _children(self):
+        # trimmed flexible restrictions of the top level (None if one of
+        # them keeps every configuration); as in flexible_scc_restrictions
+        # a component counts iff it is closed under reversal
+        components = self._top.components()
+        owner = {
+            node: component
+            for component, (nodes, _) in enumerate(components)
+            for node in nodes
+        }
+        flexible = {}  # component -> its index among the flexible ones
+        for component, (nodes, period) in enumerate(components):
+            first, second = self._nodes[nodes[0]]
+            if period == 1 and owner.get(
+                    self._position[(second, first)]) == component:
+                flexible[component] = len(flexible)
+        owner = {
+            node: flexible[component]
+            for node, component in owner.items() if component in flexible
+        }
+        for restriction in unrooted.component_restrictions(
+                self._trimmed, self._path_positions, owner, len(flexible)):
+            if len(restriction) == len(self._trimmed):
+                yield None
+                return
+            yield unrooted.trim(restriction, self._compatibility)
+
+    def _max_depth(self, configurations):
+        if self._automaton is None:
+            self._automaton = (_csr(self._nodes, self._successors),
+                               self._position, self._path_positions)
+        return unrooted.max_depth(configurations,
+                                  self._compatibility,
+                                  self._memo,
+                                  automaton=self._automaton)
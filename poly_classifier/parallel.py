@@ -0,0 +1,115 @@
+# classification of many independent problems in a process pool
+# problems and results are the dicts described in batch.py
+import collections
+import itertools
+import os
+import signal
+
+from .batch import classify_record, error_record
+from .unrooted_poly_decider import load_numpy
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _Timeout()
+
+
+def _init_worker():
+    # numpy is imported before any timeout is armed: a timeout interrupting
+    # the import would leave it half-initialised for the rest of the worker
+    load_numpy()
+
+
+def _classify_with_timeout(problem, timeout, result_cache, collect_stats,
+                           explain, budget):
+    # timeouts use SIGALRM inside the worker, so a stuck problem frees its
+    # worker; on platforms without setitimer the timeout is not enforced
+    if timeout is None or not hasattr(signal, "setitimer"):
+        return classify_record(problem, result_cache, collect_stats, explain,
+                               budget)
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return classify_record(problem, result_cache, collect_stats, explain,
+                               budget)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _classify_chunk(chunk, timeout, result_cache, collect_stats, explain,
+                    budget):
+    results = []
+    for index, problem in chunk:
+        try:
+            result = _classify_with_timeout(problem, timeout, result_cache,
+                                            collect_stats, explain, budget)
+        except _Timeout:
+            result = error_record(problem, "timeout")
+        except Exception as error:  # e.g. MemoryError, only this problem fails
+            result = error_record(problem, repr(error))
+        result["index"] = index
+        results.append(result)
+    return results
+
+
+def _chunks(problems, chunksize):
+    numbered = enumerate(problems)
+    while True:
+        chunk = list(itertools.islice(numbered, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_many(problems,
+                  workers=None,
+                  chunksize=1,
+                  ordered=True,
+                  timeout=None,
+                  result_cache=None,
+                  collect_stats=False,
+                  explain=False,
+                  budget=None):
+    # problems: iterable of problem dicts, consumed lazily
+    # workers: number of processes (default: number of CPUs)
+    # ordered: yield results in input order, otherwise as they complete
+    # timeout: seconds per problem, after which {"error": "timeout"} is reported
+    # result_cache: optional ResultCache, every worker opens its own connection
+    # collect_stats: add per-phase statistics to every result
+    # explain: add the witness of the result to every result
+    # budget: optional budget.Budget of every problem, unlike timeout it
+    # reports a lower bound of k (see batch.classify)
+    # every result carries the "index" of its problem in the input
+    import concurrent.futures
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker) as executor:
+        # only a bounded number of chunks is in flight at any time
+        window = 2 * workers
+        chunks = _chunks(problems, chunksize)
+        pending = collections.deque()
+
+        def submit(count):
+            for chunk in itertools.islice(chunks, count):
+                pending.append(
+                    executor.submit(_classify_chunk, chunk, timeout,
+                                    result_cache, collect_stats, explain,
+                                    budget))
+
+        submit(window)
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                done = [future for future in pending if future in finished]
+                for future in done:
+                    pending.remove(future)
+            submit(len(done))
+            for future in done:
+                yield from future.result()
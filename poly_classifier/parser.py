@@ -0,0 +1,96 @@
+# streaming reader of problems in the text format of the interactive mode:
+# rooted problems are a block of node configurations 'A: B C', unrooted
+# problems a block of node configurations 'A B C', an empty line and a block
+# of edge configurations 'A B'; the block ends with an empty line (or the end
+# of the input) and a file can hold many problems, optionally separated by
+# lines '---'
+import mmap
+
+from .problem import Problem
+
+DELIMITER = "---"
+
+
+def parse_configuration(line):
+    # 'A: B C' -> ('A', 'B', 'C') and 'A B C' -> ('A', 'B', 'C')
+    return tuple(label for part in line.split(":") for label in part.split())
+
+
+def read_problems(stream, delimiter=DELIMITER, skip_malformed=False):
+    # stream: any iterable of lines (str or bytes), e.g. an open file
+    # yields one Problem per problem in the stream; only the problem being
+    # read is kept in memory
+    # skip_malformed: yield the ValueError of a malformed problem instead of
+    # raising it and go on after the end of that problem
+    problem = None
+    edges = False  # reading the edge block of an unrooted problem
+    skipped_blocks = 0  # blocks of a malformed problem still to skip
+    content = False  # the previous line was part of a block
+    for number, line in enumerate(stream, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if skipped_blocks:
+            if line == delimiter:
+                skipped_blocks = 0
+            elif not line and content:
+                skipped_blocks -= 1
+            content = bool(line) and line != delimiter
+            continue
+        content = bool(line) and line != delimiter
+        if line == delimiter or not line:
+            if problem is None:
+                continue
+            if line == delimiter or problem.rooted or edges:
+                yield problem
+                problem, edges = None, False
+            else:  # end of the node block of an unrooted problem
+                edges = True
+            continue
+        try:
+            problem = _read_line(problem, edges, number, line)
+        except ValueError as error:
+            if not skip_malformed:
+                raise
+            yield error
+            # the rest of the problem: its current block and, for the node
+            # block of an unrooted problem, the edge block after it; a rooted
+            # line there means the block was a rooted problem with a
+            # malformed first line, which has no edge block
+            skipped_blocks = 1 if problem is None or problem.rooted or \
+                edges or ":" in line else 2
+            problem, edges = None, False
+    if problem is not None:
+        yield problem
+
+
+def _read_line(problem, edges, number, line):
+    # adds the configuration on line to problem (a new one if it is None)
+    rooted = ":" in line
+    if problem is None:
+        problem = Problem() if rooted else Problem(edge_configurations=())
+    elif rooted != problem.rooted:
+        raise ValueError(f"line {number}: {line!r} mixes rooted and "
+                         f"unrooted configurations")
+    if rooted and line.count(":") != 1:
+        raise ValueError(f"line {number}: {line!r} is not 'A: B C'")
+    configuration = parse_configuration(line)
+    if edges:
+        if len(configuration) != 2:
+            raise ValueError(f"line {number}: {line!r} is not 'A B'")
+        problem.add_edge_configuration(configuration)
+    else:
+        try:
+            problem.add_configuration(configuration)
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}") from None
+    return problem
+
+
+def read_problem_file(path, delimiter=DELIMITER):
+    # read_problems on a memory-mapped file
+    with open(path, "rb") as file:
+        if not file.seek(0, 2):  # empty files cannot be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from read_problems(iter(mapped.readline, b""), delimiter)
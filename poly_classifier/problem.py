@@ -0,0 +1,98 @@
+# Problem: an LCL problem with labels interned to small ints
+# problem.labels[i] is the original label with id i, node configurations are
+# stored as packed rows of ids and label subsets can be viewed as bitsets
+# (int with bit i set iff label i is in the subset)
+from array import array
+
+
+def to_bitset(label_ids):
+    bitset = 0
+    for label in label_ids:
+        bitset |= 1 << label
+    return bitset
+
+
+def from_bitset(bitset):
+    # read off the binary digits, in time linear in the width of bitset
+    return {
+        label_id
+        for label_id, digit in enumerate(reversed(bin(bitset)[2:]))
+        if digit == "1"
+    }
+
+
+class Problem:
+    # rooted problems have edge_configurations None
+
+    def __init__(self, configurations=(), edge_configurations=None):
+        self.labels = []
+        self.index = {}
+        self.width = None  # length of every node configuration
+        self._nodes = array("H")
+        self._edges = None if edge_configurations is None else array("H")
+        for conf in configurations:
+            self.add_configuration(conf)
+        for edge_conf in edge_configurations or ():
+            self.add_edge_configuration(edge_conf)
+
+    @property
+    def rooted(self):
+        return self._edges is None
+
+    def intern(self, label):
+        label_id = self.index.get(label)
+        if label_id is None:
+            label_id = self.index[label] = len(self.labels)
+            self.labels.append(label)
+            if label_id == 1 << 16:  # no longer fits into unsigned shorts
+                self._nodes = array("L", self._nodes)
+                if self._edges is not None:
+                    self._edges = array("L", self._edges)
+        return label_id
+
+    def add_configuration(self, conf):
+        if self.width is None:
+            self.width = len(conf)
+        elif len(conf) != self.width:
+            raise ValueError(
+                f"configuration {conf!r} does not have {self.width} labels")
+        row = tuple(self.intern(label) for label in conf)
+        self._nodes.extend(row)
+        return row
+
+    def add_edge_configuration(self, edge_conf):
+        if self._edges is None:
+            self._edges = array(self._nodes.typecode)
+        a, b = edge_conf
+        row = (self.intern(a), self.intern(b))
+        self._edges.extend(row)
+        return row
+
+    def configurations(self):
+        # node configurations as tuples of label ids
+        width = self.width or 1
+        nodes = self._nodes.tolist()
+        return [tuple(nodes[i:i + width]) for i in range(0, len(nodes), width)]
+
+    def multisets(self):
+        # node configurations without duplicates, with the children (rooted)
+        # or all labels (unrooted) sorted since their order does not matter
+        if self.rooted:
+            rows = ((conf[0], ) + tuple(sorted(conf[1:]))
+                    for conf in self.configurations())
+        else:
+            rows = (tuple(sorted(conf)) for conf in self.configurations())
+        return list(dict.fromkeys(rows))
+
+    def edge_configurations(self):
+        # edge configurations as pairs of label ids
+        edges = self._edges.tolist() if self._edges is not None else []
+        return list(zip(edges[::2], edges[1::2]))
+
+    def bitset(self, labels):
+        # bitset view of a set of original labels
+        return to_bitset(self.index[label] for label in labels)
+
+    def subset(self, bitset):
+        # original labels of a bitset
+        return {self.labels[label_id] for label_id in from_bitset(bitset)}
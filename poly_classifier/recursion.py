@@ -0,0 +1,86 @@
+# the max_depth recursion shared by rooted_poly_decider and
+# unrooted_poly_decider, whose subproblems are label sets and configuration
+# lists respectively
+# a subproblem is evaluated by a frame: a generator that yields the
+# subproblems it needs, receives their depth and returns its own depth
+# frames run on an explicit stack, so the Python stack depth does not grow
+# with the depth of the problem
+from .budget import OutOfBudget, partial_depth
+
+
+def max_depth(subproblem, key, frame, memo=None, stats=None):
+    # key(subproblem): its memo key
+    # frame(subproblem): a new frame evaluating subproblem
+    # memo = {key: depth} shares results between branches that trim to the
+    # same subproblem; an empty subproblem has depth 0
+    # stats: optional Stats
+    # running out of budget raises OutOfBudget with the lower bound of the
+    # depth known from the frames on the stack
+    if memo is None:
+        memo = {}
+    stack = []  # (memo key, frame) of the subproblems being evaluated
+    deepest = []  # depth of the deepest finished child of every frame
+    try:
+        while True:
+            # evaluate the subproblem: from the memo or in a new frame
+            depth = 0 if not subproblem else None
+            if subproblem:
+                subproblem_key = key(subproblem)
+                depth = memo.get(subproblem_key)
+                if depth is None:
+                    new_frame = frame(subproblem)
+                    if stats is not None:
+                        stats.enter()
+                    stack.append((subproblem_key, new_frame))
+                    deepest.append(0)
+                elif stats is not None:
+                    stats.count("memo_hits")
+            # resume frames until one of them asks for another subproblem
+            while stack:
+                subproblem_key, current = stack[-1]
+                if depth is not None:
+                    deepest[-1] = max(deepest[-1], depth)
+                try:
+                    subproblem = current.send(depth)
+                    break
+                except StopIteration as result:
+                    depth = result.value
+                    stack.pop()
+                    deepest.pop()
+                    memo[subproblem_key] = depth
+                    if stats is not None:
+                        stats.exit()
+            else:
+                return depth
+    except OutOfBudget as error:
+        error.lower_bound = max(error.lower_bound, partial_depth(deepest))
+        if stats is not None:
+            for _ in stack:
+                stats.exit()
+        raise
+
+
+def witness(subproblem, key, memo, choices, names, field):
+    # subproblems along a deepest branch of the recursion from subproblem,
+    # with the flexible restriction taken from each of them (None if there
+    # is none); the last restriction keeps the whole subproblem iff the
+    # depth is math.inf
+    # choices: filled by the frames like memo with (restriction, child) of a
+    # deepest branch, child None if the restriction keeps everything
+    # names(subproblem): its readable form, stored under field
+    path = []
+    while subproblem:
+        subproblem_key = key(subproblem)
+        restriction, child = choices[subproblem_key]
+        path.append({
+            field:
+            names(subproblem),
+            "restriction":
+            None if restriction is None else names(restriction),
+            "k":
+            memo[subproblem_key]
+        })
+        if child is None:
+            break
+        subproblem = child
+    return path
@@ -1,10 +1,16 @@
-# assumptions: δ = 2
-# configurations = [(root,child_1,child_2),...]
+# configurations = [(root,child_1,...,child_δ),...] for any δ
+# (the children form a multiset, see Problem.multisets)
 # labels = set([label_1,label_2,...])
 import math
 
-import networkx
-from rooted_tree_classifier.log_decider import isFlexible
+from . import recursion
+from .branching import BranchPool, branch_frame, check_cancelled
+from .budget import check_budget, within_budget
+from .cache import get_memo
+from .digraph import (CSRGraph, component_periods,
+                      csr_strongly_connected_components, induced_size,
+                      induced_subgraph, to_dict)
+from .problem import Problem, to_bitset
 
 
 def get_labels(configurations):
@@ -15,18 +21,45 @@ def get_labels(configurations):
     return labels
 
 
-def trim(labels, configurations):
+def trim(labels, configurations, stats=None):
     # trim outputs a subset of labels that can label any sufficiently large Δ-regular tree
     # lemma 5.28 in the paper
-    while True:
-        new_labels = get_new_labels(labels, configurations)
-        assert not (set(new_labels) - set(labels)
-                    )  # trimming labels should not introduce any new labels
-        if set(new_labels) == set(labels):
-            break
-        else:
-            labels = new_labels
-    return labels
+    # computes the fixpoint of get_new_labels by propagation: a configuration
+    # supports its root while none of its children is dead, and a label dies
+    # once it has no support left; every configuration is revisited only when
+    # one of its children dies, so this runs in linear time
+    clock = stats.clock() if stats is not None else None
+    alive = set(labels)
+    support = dict.fromkeys(alive, 0)
+    missing = [0] * len(configurations)  # dead children of each configuration
+    dependents = {label: [] for label in alive}
+    for i, conf in enumerate(configurations):
+        if conf[0] not in alive:
+            continue
+        for label in conf[1:]:
+            if label in alive:
+                dependents[label].append(i)
+            else:
+                missing[i] += 1
+        if missing[i] == 0:
+            support[conf[0]] += 1
+    dead = [label for label in alive if support[label] == 0]
+    alive.difference_update(dead)
+    while dead:
+        check_budget()
+        label = dead.pop()
+        for i in dependents[label]:
+            missing[i] += 1
+            if missing[i] == 1:
+                root = configurations[i][0]
+                support[root] -= 1
+                if support[root] == 0 and root in alive:
+                    alive.remove(root)
+                    dead.append(root)
+    if clock is not None:
+        clock.lap("trim")
+        stats.count("trimmed_labels", len(labels) - len(alive))
+    return alive
 
 
 def get_new_labels(old_labels, configurations):
@@ -45,48 +78,180 @@ def get_new_labels(old_labels, configurations):
     return new_labels
 
 
-def create_graph(labels, configurations):
-    graph = {label: [] for label in labels}
+def create_automaton(labels, configurations):
+    # automaton M as a CSRGraph over labels: head -> tail iff tail is a child
+    # of head in some configuration; every edge is kept once, so there are at
+    # most |labels|^2 edges however large δ is
+    check_budget(len(labels))
+    nodes = sorted(labels)
+    position = {label: i for i, label in enumerate(nodes)}
+    successors = [set() for _ in nodes]
     for conf in configurations:
-        head = conf[0]
-        if head in labels:
+        check_budget()
+        head = position.get(conf[0])
+        if head is not None:
             for tail in conf[1:]:
-                if tail in labels:
-                    graph[head].append(tail)
-    return graph
+                tail = position.get(tail)
+                if tail is not None:
+                    successors[head].add(tail)
+    indptr = [0]
+    indices = []
+    for tails in successors:
+        indices.extend(tails)
+        indptr.append(len(indices))
+    return CSRGraph(nodes, indptr, indices)
+
+
+def create_graph(labels, configurations):
+    # dict-of-lists view of the automaton
+    return to_dict(create_automaton(labels, configurations))
+
+
+def shared_automaton(labels, configurations, stats=None):
+    # automaton of labels with the position of every label; the automaton of
+    # any subset of labels is the subgraph it induces, so one automaton
+    # serves every level of the recursion (see max_depth)
+    clock = stats.clock() if stats is not None else None
+    automaton = create_automaton(labels, configurations)
+    position = {label: i for i, label in enumerate(automaton.nodes)}
+    if clock is not None:
+        clock.lap("shared_automaton")
+    return automaton, position
 
 
-def flexible_scc_restrictions(labels, configurations):
+def flexible_scc_restrictions(labels,
+                              configurations,
+                              stats=None,
+                              automaton=None):
     # output: list of all label restrictions
     # lemma 5.29 in the paper
+    # automaton: optional shared_automaton of a superset of labels
+    clock = stats.clock() if stats is not None else None
 
-    # create automaton M
-    graph = create_graph(labels, configurations)
+    # create automaton M, or cut it out of the shared automaton as the
+    # subgraph induced by labels, in time proportional to that subgraph
+    if automaton is None:
+        nodes, indptr, indices = create_automaton(labels, configurations)
+    else:
+        (nodes, indptr, indices), position = automaton
+        subset = [position[label] for label in labels]
+        nodes = [nodes[i] for i in subset]
+        indptr, indices = induced_subgraph(indptr, indices, subset)
+    if clock is not None:
+        clock.lap("automaton")
+        stats.record_graph(*induced_size(indptr, indices))
     # find all strongly connected component
-    nxgraph = networkx.to_networkx_graph(graph, create_using=networkx.DiGraph)
-    flexible_restrictions = []
-    for component in networkx.strongly_connected_components(nxgraph):
-        representative = list(component)[0]
-        if isFlexible(graph, representative):
-            flexible_restrictions.append(component)
-    return flexible_restrictions
-
-
-def max_depth(labels, configurations):
-    if not labels:
-        return 0
+    components = csr_strongly_connected_components(indptr, indices)
+    if clock is not None:
+        clock.lap("scc")
+    # keep the flexible ones, i.e. those whose cycle lengths have gcd 1
+    periods = component_periods(indptr, indices, components)
+    if clock is not None:
+        clock.lap("flexibility")
+    return [{nodes[i]
+             for i in component}
+            for component, period in zip(components, periods) if period == 1]
+
+
+def max_depth(labels,
+              configurations,
+              memo=None,
+              pool=None,
+              stats=None,
+              choices=None,
+              automaton=None):
+    # labels are interned label ids (see problem.Problem)
+    # memo = {bitset(labels): depth} shares results between branches that
+    # trim to the same label set
+    # pool: optional BranchPool evaluating sibling branches in parallel
+    # stats: optional Stats (not collected inside pool workers)
+    # choices: optional dict, filled like memo with (restriction, child) of
+    # a deepest branch of every evaluated subproblem (see recursion.witness)
+    # automaton: optional shared_automaton of a superset of labels
+    # runs recursion.max_depth on _max_depth frames; every subproblem is a
+    # subset of labels, the frames share its automaton
+    def frame(labels):
+        nonlocal automaton
+        if automaton is None:
+            automaton = shared_automaton(labels, configurations, stats)
+        return _max_depth(labels, configurations, pool, stats, choices,
+                          automaton)
+
+    return recursion.max_depth(labels, to_bitset, frame, memo, stats)
+
+
+def _max_depth(labels, configurations, pool, stats, choices, automaton):
+    # frame of max_depth: yields the subproblems it needs and receives their
+    # depth, returns the depth of labels
+    flexible_restrictions = flexible_scc_restrictions(labels, configurations,
+                                                      stats, automaton)
+    if pool is not None:
+        if any(not labels - restriction
+               for restriction in flexible_restrictions):
+            return math.inf
+        return (yield from branch_frame([
+            trim(restriction, configurations, stats)
+            for restriction in flexible_restrictions
+        ], to_bitset, pool, max_depth, configurations))
     maximum = 0
-    for flexible_restriction in flexible_scc_restrictions(
-            labels, configurations):
+    choice = (None, None)
+    for flexible_restriction in flexible_restrictions:
+        check_cancelled()
+        check_budget()
         if labels - flexible_restriction:  # if we removed something
-            depth = max_depth(trim(flexible_restriction, configurations),
-                              configurations)
+            child = trim(flexible_restriction, configurations, stats)
+            depth = yield child
+            if choices is not None and (choice[0] is None or depth > maximum):
+                choice = (flexible_restriction, child)
             maximum = max(maximum, depth)
         else:
+            if choices is not None:
+                choices[to_bitset(labels)] = (flexible_restriction, None)
             return math.inf
+    if choices is not None:
+        choices[to_bitset(labels)] = choice
     return 1 + maximum
 
 
-def rooted_polynomial_classifier(configurations):
+def rooted_polynomial_classifier(configurations,
+                                 cache=None,
+                                 workers=None,
+                                 stats=None,
+                                 witness=None,
+                                 budget=None):
+    # configurations: list of configurations or a rooted Problem
+    # cache: optional LRUCache that keeps subproblem results across calls
+    # workers: evaluate sibling branches of the recursion in that many
+    # processes (opt-in, worthwhile only for very hard problems)
+    # stats: optional Stats collecting timings and sizes of every phase
+    # witness: optional list, filled with the subproblems along a deepest
+    # branch of the recursion (see recursion.witness); cache and workers are
+    # then not used, as every subproblem has to be evaluated in this call
+    # budget: optional budget.Budget; once it is used up BudgetExceeded is
+    # returned instead of k, workers are not used with a budget
+    if budget is not None:
+        return within_budget(budget, rooted_polynomial_classifier,
+                             configurations, cache, None, stats, witness)
+    if not isinstance(configurations, Problem):
+        configurations = Problem(configurations)
+    problem = configurations
+    # the decider works on interned label ids
+    configurations = problem.multisets()
     labels = get_labels(configurations)
-    return max_depth(trim(labels, configurations), configurations)
+    memo = get_memo(cache, frozenset(configurations))
+    trimmed = trim(labels, configurations, stats)
+    if witness is not None:
+        memo, choices = {}, {}
+        k = max_depth(trimmed, configurations, memo, None, stats, choices)
+
+        def names(label_ids):
+            return [problem.labels[label] for label in sorted(label_ids)]
+
+        witness.extend(
+            recursion.witness(trimmed, to_bitset, memo, choices, names,
+                              "labels"))
+        return k
+    if workers is None:
+        return max_depth(trimmed, configurations, memo, None, stats)
+    with BranchPool(workers) as pool:
+        return max_depth(trimmed, configurations, memo, pool, stats)
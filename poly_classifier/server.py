@@ -0,0 +1,252 @@
+# local classification service: python -m poly_classifier serve --socket PATH
+# requests and responses are JSON lines over a Unix socket; a request is a
+# problem dict as in batch.py, its response the batch result with the same
+# "id", and responses are sent as soon as they are ready, so one connection
+# can have many requests in flight (see Client)
+# problems are classified in a process pool; isomorphic problems (same
+# canonical_key) in flight at the same time are classified once and marked
+# with "coalesced": true, finished results are kept in an in-memory LRUCache
+# (and an optional ResultCache) shared by all connections
+import asyncio
+import json
+import math
+import os
+import signal
+import stat
+
+from .batch import error_record, format_result, to_problem
+from .cache import LRUCache
+from .canonical import canonical_key
+from .parallel import _classify_chunk, _init_worker
+
+
+def _classify(problem, timeout):
+    # runs in a worker process
+    [result] = _classify_chunk([(None, problem)], timeout, None, False, False,
+                               None)
+    del result["index"]
+    return result
+
+
+def _key(problem):
+    # runs in a worker process: (rooted, canonical_key) of problem
+    interned = to_problem(problem)
+    return interned.rooted, canonical_key(interned)
+
+
+class Server:
+    def __init__(self,
+                 path,
+                 workers=None,
+                 timeout=None,
+                 result_cache=None,
+                 max_pending=None):
+        # max_pending: classifications in flight before connections stop
+        # reading requests (default: 4 per worker)
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.result_cache = result_cache
+        self.results = LRUCache()
+        self.max_pending = max_pending or 4 * self.workers
+        self._inflight = {}  # canonical key -> future of the result
+        self._connections = set()  # tasks serving the open connections
+        self._pending = self._executor = None
+
+    async def serve_forever(self):
+        import concurrent.futures
+        self._pending = asyncio.Semaphore(self.max_pending)
+        if os.path.exists(self.path) and stat.S_ISSOCK(
+                os.stat(self.path).st_mode):
+            os.unlink(self.path)  # left behind by a server that was killed
+        with concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker) as self._executor:
+            server = await asyncio.start_unix_server(self._connection,
+                                                     self.path)
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, server.close)
+            try:
+                async with server:
+                    try:
+                        await server.serve_forever()
+                    except asyncio.CancelledError:  # closed by SIGTERM
+                        pass
+                    finally:
+                        # open connections are dropped, their handlers
+                        # return quietly (see _connection)
+                        for task in self._connections:
+                            task.cancel()
+                        await asyncio.gather(*self._connections)
+            finally:
+                os.unlink(self.path)
+
+    async def _connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(result):
+            async with lock:
+                try:
+                    writer.write(format_result(result).encode() + b"\n")
+                    await writer.drain()
+                except ConnectionError:  # the client is gone, drop result
+                    pass
+
+        async def handle(problem):
+            try:
+                try:
+                    result = await self.classify(problem)
+                except Exception as error:  # e.g. a worker died
+                    result = error_record(problem, repr(error))
+                await respond(result)
+            finally:
+                self._pending.release()
+
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    problem = json.loads(line)
+                except ValueError as error:
+                    await respond({"error": repr(error)})
+                    continue
+                # backpressure: no further request is read while max_pending
+                # classifications are in flight; waiting for a request does
+                # not count, so idle connections hold no permit
+                await self._pending.acquire()
+                task = asyncio.ensure_future(handle(problem))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except asyncio.CancelledError:  # server shutting down
+            for task in tasks:
+                task.cancel()
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def classify(self, problem):
+        # batch result of problem
+        # the key can take a while for large problems, so it is computed in
+        # the pool as well rather than in the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            rooted, key = await loop.run_in_executor(self._executor, _key,
+                                                     problem)
+        except (KeyError, TypeError, ValueError) as error:
+            return error_record(problem, repr(error))
+        if key is None:  # too symmetric to cache or coalesce
+            return self._result(
+                problem, await loop.run_in_executor(self._executor, _classify,
+                                                    problem, self.timeout))
+        k = self.results.get(key)
+        if k is None and self.result_cache is not None:
+            k = self.result_cache.get(key)
+        if k is not None:
+            return self._result(problem, {
+                "type": "rooted" if rooted else "unrooted",
+                "k": k,
+                "cached": True
+            })
+        future = self._inflight.get(key)
+        if future is not None:
+            result = await asyncio.shield(future)
+            return self._result(problem, dict(result, coalesced=True))
+        future = self._inflight[key] = loop.run_in_executor(
+            self._executor, _classify, problem, self.timeout)
+        try:
+            result = await future
+        finally:
+            del self._inflight[key]
+        if "k" in result:
+            self.results[key] = result["k"]
+            if self.result_cache is not None:
+                self.result_cache[key] = result["k"]
+        return self._result(problem, result)
+
+    def _result(self, problem, result):
+        # result of a (possibly isomorphic) problem with the id of problem
+        result = {key: value for key, value in result.items() if key != "id"}
+        if "id" in problem:
+            result = dict(id=problem["id"], **result)
+        return result
+
+
+def serve(path,
+          workers=None,
+          timeout=None,
+          result_cache=None,
+          max_pending=None):
+    server = Server(path, workers, timeout, result_cache, max_pending)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+class Client:
+    # pipelining client of a Server, used as an async context manager:
+    #   async with Client(path) as client:
+    #       results = await asyncio.gather(*map(client.classify, problems))
+    # every request is sent at once and responses are matched by their id
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = self._writer = self._receiver = None
+        self._waiting = {}  # request id -> future of the response
+        self._ids = 0
+        self._lock = None
+
+    async def __aenter__(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            self.path)
+        self._receiver = asyncio.ensure_future(self._receive())
+        self._lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._receiver.cancel()
+
+    async def _receive(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            result = json.loads(line)
+            future = self._waiting.pop(result.pop("id", None), None)
+            if future is not None and not future.done():
+                future.set_result(result)
+        for future in self._waiting.values():
+            future.set_exception(ConnectionError("server closed connection"))
+
+    async def classify(self, problem):
+        # problem: problem dict (its id is replaced by the client's own)
+        # output: the batch result without id, "k" is math.inf for O(log n)
+        self._ids += 1
+        request_id = self._ids
+        future = self._waiting[request_id] = (
+            asyncio.get_running_loop().create_future())
+        async with self._lock:
+            self._writer.write(
+                json.dumps(dict(problem, id=request_id)).encode() + b"\n")
+            await self._writer.drain()
+        result = await future
+        if result.get("k") == "inf":
+            result["k"] = math.inf
+        return result
+
+
+def classify_remote(path, problems):
+    # results of all problems, classified by the server at path with every
+    # request pipelined on one connection
+    async def run():
+        async with Client(path) as client:
+            return await asyncio.gather(*map(client.classify, problems))
+
+    return asyncio.run(run())
@@ -0,0 +1,80 @@
+# optional instrumentation of the classifiers
+# pass stats=Stats() to rooted_polynomial_classifier or
+# unrooted_polynomial_classifier; without it nothing is recorded
+import time
+from collections import Counter, defaultdict
+
+
+class Stats:
+    def __init__(self):
+        self.timings = defaultdict(float)  # phase -> seconds
+        self.calls = Counter()  # phase or event -> count
+        self.graphs = []  # (recursion depth, nodes, edges) of every automaton
+        self.depth = 0  # current recursion depth of max_depth
+        self.max_depth = 0
+
+    def clock(self):
+        return _Clock(self)
+
+    def enter(self):
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.calls["subproblems"] += 1
+
+    def exit(self):
+        self.depth -= 1
+
+    def count(self, event, n=1):
+        self.calls[event] += n
+
+    def record_graph(self, nodes, edges):
+        self.graphs.append((self.depth, nodes, edges))
+
+    def as_dict(self):
+        levels = {}
+        for depth, nodes, edges in self.graphs:
+            level = levels.setdefault(depth, {
+                "graphs": 0,
+                "nodes": 0,
+                "edges": 0
+            })
+            level["graphs"] += 1
+            level["nodes"] += nodes
+            level["edges"] += edges
+        return {
+            "timings": dict(self.timings),
+            "calls": dict(self.calls),
+            "recursion_depth": self.max_depth,
+            "levels": {
+                str(depth): levels[depth]
+                for depth in sorted(levels)
+            },
+        }
+
+    def __str__(self):
+        lines = [f"recursion depth: {self.max_depth}"]
+        for phase, seconds in sorted(self.timings.items(),
+                                     key=lambda item: -item[1]):
+            lines.append(f"{phase}: {seconds * 1000:.3f} ms "
+                         f"in {self.calls[phase]} calls")
+        for event, count in sorted(self.calls.items()):
+            if event not in self.timings:
+                lines.append(f"{event}: {count}")
+        for depth, level in self.as_dict()["levels"].items():
+            lines.append(f"level {depth}: {level['graphs']} automata with "
+                         f"{level['nodes']} nodes and {level['edges']} edges")
+        return "\n".join(lines)
+
+
+class _Clock:
+    # lap(phase) adds the time since the previous lap to phase
+
+    def __init__(self, stats):
+        self._stats = stats
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self._stats.timings[phase] += now - self._last
+        self._stats.calls[phase] += 1
+        self._last = now
@@ -1,14 +1,18 @@
-# assumptions: Δ = 3
-# configurations = [(root,child_1,child_2),...] (node configurations)
+# configurations = [(label_1,...,label_Δ),...] (node configurations, multisets of Δ labels for any Δ)
 # edge_configurations = [(half_1,half_2),...] (edge configuraitons)
+# compatibility = {label: set([label_1,...]),...} (symmetric index of edge configurations)
 # labels = set([label_1,label_2,...])
 import itertools
 import math
 
-from networkx.utils.union_find import UnionFind
-from rooted_tree_classifier.log_decider import isFlexible
-
-delta = 3
+from . import recursion
+from .branching import BranchPool, branch_frame, check_cancelled
+from .budget import check_budget, within_budget
+from .cache import get_memo
+from .digraph import (CSRGraph, component_periods,
+                      csr_strongly_connected_components, induced_size,
+                      induced_subgraph, is_cyclic_component, to_dict)
+from .problem import Problem
 
 
 def get_labels(configurations):
@@ -19,48 +23,95 @@ def get_labels(configurations):
     return labels
 
 
-def trim(configurations, edge_configurations):
+def get_compatibility(edge_configurations):
+    # symmetric edge-compatibility index: label -> set of labels it can share an edge with
+    compatibility = {}
+    for a, b in edge_configurations:
+        compatibility.setdefault(a, set()).add(b)
+        compatibility.setdefault(b, set()).add(a)
+    return compatibility
+
+
+def has_partner(compatibility, label, labels):
+    partners = compatibility.get(label)
+    return partners is not None and not partners.isdisjoint(labels)
+
+
+def trim(configurations, compatibility, stats=None):
     # trim outputs a subset of configurations that can label any sufficiently large Δ-regular tree
     # lemma 4.24 in the paper
-    labels = get_labels(configurations)
-    while True:
-        new_labels = get_new_labels(configurations, edge_configurations,
-                                    labels)
-        assert not (set(new_labels) - set(labels))
-        if set(new_labels) == set(labels):
-            break
+    # computes the fixpoint of get_new_labels by propagation: partners[label]
+    # counts the alive labels compatible with label (label is valid while it
+    # is positive), invalid[i] counts the invalid positions of configuration
+    # i, supported[i] is the set of labels get_new_labels adds for it and
+    # support[label] counts the configurations adding label; a label dies
+    # once it has no support left, and configurations are revisited only
+    # when one of their labels becomes invalid
+    clock = stats.clock() if stats is not None else None
+    alive = get_labels(configurations)
+    partners = {
+        label: len(compatibility.get(label, set()) & alive)
+        for label in alive
+    }
+    containing = {label: [] for label in alive}
+    invalid = [0] * len(configurations)
+    supported = []
+    support = dict.fromkeys(alive, 0)
+    for i, conf in enumerate(configurations):
+        for label in set(conf):
+            containing[label].append(i)
+        invalid_labels = [label for label in conf if partners[label] == 0]
+        invalid[i] = len(invalid_labels)
+        if invalid[i] == 0:
+            supported.append(set(conf))
+        elif invalid[i] == 1:
+            supported.append(set(invalid_labels))
         else:
-            labels = new_labels
+            supported.append(set())
+        for label in supported[i]:
+            support[label] += 1
+    dead = [label for label in alive if support[label] == 0]
+    alive.difference_update(dead)
+    while dead:
+        check_budget()
+        label = dead.pop()
+        for partner in compatibility.get(label, ()):
+            if partner not in partners:
+                continue
+            partners[partner] -= 1
+            if partners[partner] != 0:
+                continue
+            # partner became invalid
+            for i in containing[partner]:
+                invalid[i] += configurations[i].count(partner)
+                # with a single invalid position only that label is added
+                after = {partner} if invalid[i] == 1 else set()
+                lost_labels = supported[i] - after
+                supported[i] = after
+                for lost in lost_labels:
+                    support[lost] -= 1
+                    if support[lost] == 0 and lost in alive:
+                        alive.remove(lost)
+                        dead.append(lost)
     # trim configurations
     trimmed_configurations = []
-    for conf in configurations:
-        ok = True
-        for first_label in conf:
-            found = False
-            for sec_label in labels:
-                if (first_label, sec_label) in edge_configurations or \
-                        (sec_label, first_label) in edge_configurations:
-                    found = True
-            if not found:
-                ok = False
-                break
-        if ok:
+    for i, conf in enumerate(configurations):
+        if invalid[i] == 0:
             trimmed_configurations.append(conf)
+    if clock is not None:
+        clock.lap("trim")
+        stats.count("trimmed_configurations",
+                    len(configurations) - len(trimmed_configurations))
     return trimmed_configurations
 
 
-def get_new_labels(configurations, edge_configurations, old_labels):
+def get_new_labels(configurations, compatibility, old_labels):
     new_labels = set()
     for conf in configurations:
         invalid_count = 0
         invalid_representative = None
         for label in conf:
-            found = False
-            for sec_label in old_labels:
-                if (label, sec_label) in edge_configurations or \
-                        (sec_label, label) in edge_configurations:
-                    found = True
-            if not found:
+            if not has_partner(compatibility, label, old_labels):
                 invalid_count += 1
                 invalid_representative = label
         if invalid_count == 0:
@@ -72,87 +123,307 @@ def get_new_labels(configurations, edge_configurations, old_labels):
     return new_labels
 
 
-def create_graph(configurations, edge_configurations):
-    path_configurations = set(
-        itertools.chain(
-            *[itertools.permutations(conf, 2) for conf in configurations]))
-    graph = {path_conf: [] for path_conf in path_configurations}
-    for s, edges in graph.items():
-        for t in graph.keys():
-            if (s[1], t[0]) in edge_configurations or \
-                    (t[0], s[1]) in edge_configurations:
-                edges.append(t)
-    return graph
-
-
-def is_reachable(graph, s, t, vis=None):
-    if vis is None:
-        vis = set()
-    if s not in vis:
-        vis.add(s)
-        for c in graph[s]:
-            if c == t:
-                return True
-            if is_reachable(graph, c, t, vis):
-                return True
-        return False
-
-
-def restrict(configurations, multisets):
-    restricted = []
+def get_path_configurations(conf):
+    # ordered pairs of labels at two distinct positions of conf; computed
+    # from the label counts, so there are at most (number of distinct
+    # labels)^2 of them instead of Δ(Δ-1) with repetitions
+    counts = {}
+    for label in conf:
+        counts[label] = counts.get(label, 0) + 1
+    return [(a, b) for a in counts for b in counts if a != b or counts[a] > 1]
+
+
+def load_numpy():
+    # numpy is imported on first use to keep importing the package fast;
+    # the classifiers import it before any clock starts, so that statistics
+    # and budgets measure the classification only
+    import numpy
+    return numpy
+
+
+def _ranges(starts, lengths):
+    # concatenation of the ranges [start, start + length)
+    numpy = load_numpy()
+    ends = numpy.cumsum(lengths)
+    return numpy.arange(ends[-1] if len(ends) else 0) + numpy.repeat(
+        starts - ends + lengths, lengths)
+
+
+def create_automaton(configurations, compatibility):
+    # automaton M as a CSRGraph over path configurations
+    numpy = load_numpy()
+    path_configurations = list(
+        set(
+            itertools.chain.from_iterable(
+                get_path_configurations(conf) for conf in configurations)))
+    check_budget(len(path_configurations))
+    labels = list(
+        {label
+         for path_conf in path_configurations
+         for label in path_conf})
+    code = {label: i for i, label in enumerate(labels)}
+    first = numpy.array([code[s[0]] for s in path_configurations],
+                        dtype=numpy.intp)
+    second = numpy.array([code[s[1]] for s in path_configurations],
+                         dtype=numpy.intp)
+    compatible = numpy.zeros((len(labels), len(labels)), dtype=bool)
+    for label in labels:
+        for partner in compatibility.get(label, ()):
+            if partner in code:
+                compatible[code[label], code[partner]] = True
+    # s -> t iff compatible[s[1], t[0]]: the successors of s are the groups of
+    # nodes whose first label is a partner of s[1], so they are gathered
+    # group by group and no labels x nodes matrix is built
+    order = numpy.argsort(first, kind="stable")  # nodes grouped by t[0]
+    group_size = numpy.bincount(first, minlength=len(labels))
+    group_start = numpy.concatenate(([0], numpy.cumsum(group_size)[:-1]))
+    # (label, partner) pairs with a nonempty group, grouped by label
+    pair_labels, pair_partners = numpy.nonzero(compatible
+                                               & (group_size > 0))
+    pair_count = numpy.bincount(pair_labels, minlength=len(labels))
+    pair_start = numpy.concatenate(([0], numpy.cumsum(pair_count)[:-1]))
+    label_degree = numpy.bincount(pair_labels,
+                                  weights=group_size[pair_partners],
+                                  minlength=len(labels)).astype(numpy.intp)
+    degree = label_degree[second]
+    indptr = numpy.concatenate(([0], numpy.cumsum(degree)))
+    # the gathers below hold at most five arrays with an entry per edge
+    check_budget(allocate=5 * int(indptr[-1]) * indptr.itemsize)
+    # groups of the successors of every node, in node order
+    pairs = _ranges(pair_start[second], pair_count[second])
+    groups = pair_partners[pairs]
+    indices = order[_ranges(group_start[groups], group_size[groups])]
+    check_budget()
+    return CSRGraph(path_configurations, indptr, indices)
+
+
+def create_graph(configurations, compatibility):
+    # dict-of-lists view of the automaton
+    return to_dict(create_automaton(configurations, compatibility))
+
+
+def shared_automaton(configurations, compatibility, stats=None):
+    # automaton of configurations (with list indptr/indices), the position
+    # of every path configuration and, for every configuration, the tuple of
+    # the positions of its path configurations; the automaton of any subset
+    # of configurations is the subgraph induced by its path configurations,
+    # so one automaton serves every level of the recursion (see max_depth)
+    clock = stats.clock() if stats is not None else None
+    automaton = create_automaton(configurations, compatibility)
+    # a list slot and an int object per edge
+    check_budget(allocate=40 * len(automaton.indices))
+    automaton = CSRGraph(automaton.nodes, automaton.indptr.tolist(),
+                         automaton.indices.tolist())
+    position = {path_conf: i for i, path_conf in enumerate(automaton.nodes)}
+    path_positions = {}
     for conf in configurations:
-        ok = True
-        for permutation in itertools.permutations(conf, 2):
-            if not permutation in multisets:
-                ok = False
-                break
-        if ok:
-            restricted.append(conf)
-    return restricted
+        check_budget()
+        path_positions[conf] = tuple(
+            position[path_conf]
+            for path_conf in get_path_configurations(conf))
+    if clock is not None:
+        clock.lap("shared_automaton")
+    return automaton, position, path_positions
 
 
-def flexible_scc_restrictions(configurations, edge_configurations):
+def component_restrictions(configurations, path_positions, owner, count):
+    # the configurations all of whose path configurations are in component
+    # c, for every component c < count; owner[position] is the
+    # component containing that position (if any), so every configuration is
+    # looked at once whatever the number of components
+    restrictions = [[] for _ in range(count)]
+    for conf in configurations:
+        positions = path_positions[conf]
+        if not positions:  # no path configuration (Δ = 1) is never outside
+            for restriction in restrictions:
+                restriction.append(conf)
+            continue
+        component = owner.get(positions[0])
+        if component is not None and all(
+                owner.get(position) == component
+                for position in positions[1:]):
+            restrictions[component].append(conf)
+    return restrictions
+
+
+def flexible_scc_restrictions(configurations,
+                              compatibility,
+                              stats=None,
+                              automaton=None):
     # output: list of all restrictions
     # lemma 4.25 in the paper
+    # automaton: optional shared_automaton of a superset of configurations
+    clock = stats.clock() if stats is not None else None
 
-    # create automaton M
-    graph = create_graph(configurations, edge_configurations)
+    # create automaton M, or cut it out of the shared automaton as the
+    # subgraph induced by the path configurations of configurations, in time
+    # proportional to that subgraph; ids[i] is the position of node i in the
+    # automaton, used by position and path_positions
+    if automaton is None:
+        automaton = shared_automaton(configurations, compatibility)
+    (nodes, indptr, indices), position, path_positions = automaton
+    ids = range(len(nodes))
+    # configurations are a subset of those the automaton was built from, so
+    # with as many of them the automaton is used as it is
+    if len(configurations) < len(path_positions):
+        ids = list(
+            dict.fromkeys(
+                itertools.chain.from_iterable(
+                    path_positions[conf] for conf in configurations)))
+        indptr, indices = induced_subgraph(indptr, indices, ids)
+    if clock is not None:
+        clock.lap("automaton")
+        stats.record_graph(*induced_size(indptr, indices))
     # find all strongly connected component (as defined in Definition 4.4)
-    components = UnionFind()
-    for s in graph.keys():
-        for t in graph.keys():
-            if (is_reachable(graph, s, t)
-                    and is_reachable(graph, s, (t[1], t[0]))
-                    and is_reachable(graph, (s[1], s[0]), t)
-                    and is_reachable(graph, (s[1], s[0]), (t[1], t[0]))):
-                components.union(s, t)
-
-    flexible_restrictions = []
+    # s -> t implies (t[1], t[0]) -> (s[1], s[0]), so s and t are reachable from
+    # each other in both orientations iff the ordinary SCC containing them is
+    # closed under reversal; such SCCs are exactly the components we want
+    components = []
+    for component in csr_strongly_connected_components(indptr, indices):
+        representative = nodes[ids[component[0]]]
+        reversal = position[(representative[1], representative[0])]
+        if reversal in (ids[i] for i in component) and \
+                is_cyclic_component(indptr, indices, component):
+            components.append(component)
+    if clock is not None:
+        clock.lap("scc")
+
     # for each component check if it is path-flexible
-    # if yes, add it to flexible restrictions
-    for component in components.to_sets():
-        representative = list(component)[0]
-        if isFlexible(graph, representative):
-            flexible_restrictions.append(restrict(configurations, component))
+    # if yes, add its restriction to flexible restrictions
+    periods = component_periods(indptr, indices, components)
+    if clock is not None:
+        clock.lap("flexibility")
+    owner = {}
+    count = 0
+    for component, period in zip(components, periods):
+        check_budget()
+        if period == 1:
+            for i in component:
+                owner[ids[i]] = count
+            count += 1
+    flexible_restrictions = component_restrictions(configurations,
+                                                   path_positions, owner,
+                                                   count)
+    if clock is not None:
+        clock.lap("restrict")
     return flexible_restrictions
 
 
-def max_depth(configurations, edge_configurations):
-    if not configurations:
-        return 0
+def max_depth(configurations,
+              compatibility,
+              memo=None,
+              pool=None,
+              stats=None,
+              choices=None,
+              automaton=None):
+    # memo = {frozenset(configurations): depth} shares results between
+    # branches that trim to the same configuration set
+    # pool: optional BranchPool evaluating sibling branches in parallel
+    # stats: optional Stats (not collected inside pool workers)
+    # choices: optional dict, filled like memo with (restriction, child) of
+    # a deepest branch of every evaluated subproblem (see recursion.witness)
+    # automaton: optional shared_automaton of a superset of configurations
+    # runs recursion.max_depth on _max_depth frames; every subproblem is a
+    # subset of configurations, the frames share its automaton
+    def frame(configurations):
+        nonlocal automaton
+        if automaton is None:
+            automaton = shared_automaton(configurations, compatibility, stats)
+        return _max_depth(configurations, compatibility, pool, stats, choices,
+                          automaton)
+
+    return recursion.max_depth(configurations, frozenset, frame, memo, stats)
+
+
+def _max_depth(configurations, compatibility, pool, stats, choices, automaton):
+    # frame of max_depth: yields the subproblems it needs and receives their
+    # depth, returns the depth of configurations
+    flexible_restrictions = flexible_scc_restrictions(configurations,
+                                                      compatibility, stats,
+                                                      automaton)
+    if pool is not None:
+        # restrictions are sublists of configurations
+        if any(
+                len(restriction) == len(configurations)
+                for restriction in flexible_restrictions):
+            return math.inf
+        return (yield from branch_frame([
+            trim(restriction, compatibility, stats)
+            for restriction in flexible_restrictions
+        ], frozenset, pool, max_depth, compatibility))
     maximum = 0
-    for flexible_restriction in flexible_scc_restrictions(
-            configurations, edge_configurations):
-        if set(configurations) - set(
-                flexible_restriction):  # if we removed something
-            depth = max_depth(trim(flexible_restriction, edge_configurations),
-                              edge_configurations)
+    choice = (None, None)
+    for flexible_restriction in flexible_restrictions:
+        check_cancelled()
+        check_budget()
+        # restrictions are sublists of configurations
+        if len(flexible_restriction) < len(
+                configurations):  # if we removed something
+            child = trim(flexible_restriction, compatibility, stats)
+            depth = yield child
+            if choices is not None and (choice[0] is None or depth > maximum):
+                choice = (flexible_restriction, child)
             maximum = max(maximum, depth)
         else:
+            if choices is not None:
+                choices[frozenset(configurations)] = (flexible_restriction,
+                                                      None)
             return math.inf
+    if choices is not None:
+        choices[frozenset(configurations)] = choice
     return 1 + maximum
 
 
-def unrooted_polynomial_classifier(configurations, edge_configurations):
-    return max_depth(trim(configurations, edge_configurations),
-                     edge_configurations)
+def unrooted_polynomial_classifier(configurations,
+                                   edge_configurations=None,
+                                   cache=None,
+                                   workers=None,
+                                   stats=None,
+                                   witness=None,
+                                   budget=None):
+    # configurations: list of node configurations or an unrooted Problem
+    # (edge_configurations are then taken from the problem)
+    # cache: optional LRUCache that keeps subproblem results across calls
+    # workers: evaluate sibling branches of the recursion in that many
+    # processes (opt-in, worthwhile only for very hard problems)
+    # stats: optional Stats collecting timings and sizes of every phase
+    # witness: optional list, filled with the subproblems along a deepest
+    # branch of the recursion (see recursion.witness); cache and workers are
+    # then not used, as every subproblem has to be evaluated in this call
+    # budget: optional budget.Budget; once it is used up BudgetExceeded is
+    # returned instead of k, workers are not used with a budget
+    load_numpy()
+    if budget is not None:
+        return within_budget(budget, unrooted_polynomial_classifier,
+                             configurations, edge_configurations, cache, None,
+                             stats, witness)
+    if not isinstance(configurations, Problem):
+        configurations = Problem(configurations, edge_configurations or [])
+    problem = configurations
+    # the decider works on interned label ids
+    edge_configurations = problem.edge_configurations()
+    configurations = problem.multisets()
+    compatibility = get_compatibility(edge_configurations)
+    # subproblem results depend on the edge configurations only through
+    # the (unordered) compatibility relation
+    memo = get_memo(cache, frozenset(map(frozenset, edge_configurations)))
+    configurations = trim(configurations, compatibility, stats)
+    if witness is not None:
+        memo, choices = {}, {}
+        k = max_depth(configurations, compatibility, memo, None, stats,
+                      choices)
+
+        def names(confs):
+            return [
+                tuple(problem.labels[label] for label in conf)
+                for conf in sorted(confs)
+            ]
+
+        witness.extend(
+            recursion.witness(configurations, frozenset, memo, choices, names,
+                              "configurations"))
+        return k
+    if workers is None:
+        return max_depth(configurations, compatibility, memo, None, stats)
+    with BranchPool(workers) as pool:
+        return max_depth(configurations, compatibility, memo, pool, stats)
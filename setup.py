@@ -20,4 +20,4 @@ setup(
     ],
     packages=["poly_classifier"],
     include_package_data=True,
-    install_requires=["rooted_tree_classifier", "networkx"])
+    install_requires=["numpy"])
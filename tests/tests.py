@@ -10,13 +10,35 @@
 # by Alkida Balliu, Sebastian Brandt, Yi-Jun Chang, Dennis Olivetti, Jan Studený, Jukka Suomela, Aleksandr Tereshchenko
 # https://arxiv.org/abs/2102.09277
 
+import asyncio
+import inspect
+import io
 import itertools
+import json
+import math
+import os
 import random
+import socket
 import string
 import subprocess
 import sys
+import tempfile
+import time
 import unittest
-from poly_classifier.unrooted_poly_decider import get_new_labels, unrooted_polynomial_classifier
+from rooted_tree_classifier.log_decider import isFlexible
+from poly_classifier import parser, rooted_poly_decider, unrooted_poly_decider
+from poly_classifier.batch import classify_record
+from poly_classifier.branching import BranchPool
+from poly_classifier.budget import Budget, BudgetExceeded, OutOfBudget, check_budget
+from poly_classifier.cache import LRUCache, ResultCache
+from poly_classifier.canonical import canonical_key
+from poly_classifier.incremental import IncrementalRootedClassifier, IncrementalUnrootedClassifier
+from poly_classifier.parallel import classify_many
+from poly_classifier.problem import Problem
+from poly_classifier.server import Client, classify_remote
+from poly_classifier.stats import Stats
+from poly_classifier.digraph import IncrementalComponents, component_periods, csr_strongly_connected_components, from_dict, induced_subgraph, strongly_connected_components, to_dict
+from poly_classifier.unrooted_poly_decider import create_automaton, create_graph, get_compatibility, get_new_labels, unrooted_polynomial_classifier
 from poly_classifier.rooted_poly_decider import rooted_polynomial_classifier
 
 sqrt_rooted_1 = \
@@ -197,16 +219,333 @@ k : j j
 """
 
 
+def reachability(indptr, indices):
+    # bitset per node of the nodes reachable from it by a nonempty path
+    reach = []
+    for node in range(len(indptr) - 1):
+        seen = 0
+        queue = indices[indptr[node]:indptr[node + 1]]
+        for succ in queue:
+            if not seen >> succ & 1:
+                seen |= 1 << succ
+                queue.extend(indices[indptr[succ]:indptr[succ + 1]])
+        reach.append(seen)
+    return reach
+
+
+def restrict(configurations, multisets):
+    # configurations all of whose path configurations are in multisets
+    restricted = []
+    for conf in configurations:
+        ok = True
+        for path_conf in unrooted_poly_decider.get_path_configurations(conf):
+            if not path_conf in multisets:
+                ok = False
+                break
+        if ok:
+            restricted.append(conf)
+    return restricted
+
+
+class FailingBudget(Budget):
+    # a budget whose checks fail as if memory had run out
+    def check(self, nodes=None, allocate=None):
+        raise MemoryError()
+
+
+def create_rooted_k_problem(k):
+    # rooted problem of complexity Θ(n^(1/k))
+    configurations = []
+
+    def gen(l, s, t):
+        return [f'{l}{j}' for j in range(s, t + 1)]
+
+    for i in range(1, k + 1):
+        ss = gen('a', 1, i - 1) + gen('b', 1, i) + gen('x', 1, i - 1)
+        for s1 in ss:
+            for s2 in ss:
+                configurations.append([f'a{i}', s1, s2])
+    for i in range(1, k + 1):
+        ss = gen('a', 1, i) + gen('b', 1, i - 1) + gen('x', 1, i - 1)
+        for s1 in ss:
+            for s2 in ss:
+                configurations.append([f'b{i}', s1, s2])
+    for i in range(1, k):
+        ss1 = gen('a', 1, k) + gen('b', 1, k) + gen('x', 1, k - 1)
+        ss2 = gen('a', 1, i) + gen('b', 1, i) + gen('x', 1, i - 1)
+        for s1 in ss1:
+            for s2 in ss2:
+                configurations.append([f'x{i}', s1, s2])
+    return configurations
+
+
+def create_unrooted_k_problem(k):
+    # unrooted problem of complexity Θ(n^(1/k))
+    comp_confs = [(f"x{i}", f"x{i}", f"y{i}") for i in range(k)]
+    rake_confs = [(f"a{i}", f"b{i}", f"b{i}") for i in range(k)]
+    rake_star_confs = [(f"b{i}", f"b{i}", f"b{i}") for i in range(k)]
+
+    configurations = list(
+        itertools.chain(comp_confs, rake_confs, rake_star_confs))
+
+    edge_confs_1 = [(f"a{i}", f"a{i}")
+                    for i in range(k)] + [(f"x{i}", f"x{i}") for i in range(k)]
+    edge_confs_2 = [(f"x{i}", f"b{j}") for j in range(k) for i in range(k) if i < j] + \
+                   [(f"x{i}", f"y{j}") for j in range(k) for i in range(k) if i < j]
+    edge_confs_3 = [(f"a{i}", f"b{j}") for j in range(k) for i in range(k) if i <= j] + \
+                   [(f"a{i}", f"y{j}") for j in range(k) for i in range(k) if i <= j]
+    edge_configurations = list(
+        itertools.chain(edge_confs_1, edge_confs_2, edge_confs_3))
+    return configurations, edge_configurations
+
+
 class TestE2E(unittest.TestCase):
     def testPolyDecider(self):
-        result = get_new_labels([('A', 'A', 'A')], [('A', 'A')], ['A'])
+        result = get_new_labels([('A', 'A', 'A')],
+                                get_compatibility([('A', 'A')]), ['A'])
         self.assertEqual(result, set('A'))
 
+    def testCompatibilityIsSymmetric(self):
+        compatibility = get_compatibility([('a', 'b'), ('b', 'c'), ('c', 'c')])
+        self.assertEqual(compatibility, {
+            'a': {'b'},
+            'b': {'a', 'c'},
+            'c': {'b', 'c'}
+        })
+
+    def testTrimMatchesNaiveFixpoint(self):
+        def naive_rooted_trim(labels, configurations):
+            while True:
+                new_labels = rooted_poly_decider.get_new_labels(
+                    labels, configurations)
+                if new_labels == set(labels):
+                    return new_labels
+                labels = new_labels
+
+        def naive_unrooted_trim(configurations, compatibility):
+            labels = unrooted_poly_decider.get_labels(configurations)
+            while True:
+                new_labels = get_new_labels(configurations, compatibility,
+                                            labels)
+                if new_labels == labels:
+                    break
+                labels = new_labels
+            return [
+                conf for conf in configurations if all(
+                    unrooted_poly_decider.has_partner(
+                        compatibility, label, labels) for label in conf)
+            ]
+
+        for seed in range(300):
+            random.seed(seed)
+            ss = string.ascii_lowercase[:random.randint(1, 8)]
+            configurations = [
+                tuple(random.choices(ss, k=3))
+                for _ in range(random.randint(0, 20))
+            ]
+            compatibility = get_compatibility([
+                tuple(random.choices(ss, k=2))
+                for _ in range(random.randint(0, 12))
+            ])
+            labels = set(random.sample(ss, random.randint(0, len(ss))))
+            self.assertEqual(rooted_poly_decider.trim(labels, configurations),
+                             naive_rooted_trim(labels, configurations))
+            self.assertEqual(
+                unrooted_poly_decider.trim(configurations, compatibility),
+                naive_unrooted_trim(configurations, compatibility))
+
+    def testStronglyConnectedComponents(self):
+        graph = {1: [2], 2: [3], 3: [1, 4], 4: [5], 5: [4], 6: [6]}
+        components = strongly_connected_components(graph)
+        self.assertCountEqual(map(frozenset, components),
+                              [{1, 2, 3}, {4, 5}, {6}])
+
+    def testStronglyConnectedComponentsLongCycle(self):
+        n = 100000  # far beyond the default recursion limit
+        graph = {i: [(i + 1) % n] for i in range(n)}
+        components = strongly_connected_components(graph)
+        self.assertEqual(len(components), 1)
+        self.assertEqual(len(components[0]), n)
+
+    def testInducedSubgraph(self):
+        # the subgraph induced by a subset, cut out of the whole graph, is
+        # the subgraph built on its own, with the same components
+        random.seed(0)
+        for _ in range(200):
+            n = random.randint(1, 15)
+            graph = {
+                i: random.choices(range(n), k=random.randint(0, 3))
+                for i in range(n)
+            }
+            subset = random.sample(range(n), random.randint(1, n))
+            induced = from_dict({
+                node: [succ for succ in graph[node] if succ in subset]
+                for node in subset
+            })
+            csr = from_dict(graph)
+            indptr, indices = induced_subgraph(csr.indptr, csr.indices, subset)
+            self.assertEqual((indptr, indices),
+                             (induced.indptr, induced.indices))
+            components = csr_strongly_connected_components(indptr, indices)
+            self.assertCountEqual(
+                [{subset[i] for i in component} for component in components],
+                strongly_connected_components(to_dict(induced)))
+
+    def testComponentPeriodsMatchIsFlexible(self):
+        random.seed(0)
+        graphs = []
+        for _ in range(200):
+            n = random.randint(1, 8)
+            graphs.append({
+                i:
+                list(set(random.choices(range(n), k=random.randint(0, 3))))
+                for i in range(n)
+            })
+        graphs.append(
+            create_graph([('a', 'b', 'b'), ('a', 'a', 'c'), ('c', 'c', 'c')],
+                         get_compatibility([('b', 'a'), ('c', 'c'),
+                                            ('a', 'c')])))
+        for graph in graphs:
+            csr = from_dict(graph)
+            components = csr_strongly_connected_components(
+                csr.indptr, csr.indices)
+            periods = component_periods(csr.indptr, csr.indices, components)
+            for component, period in zip(components, periods):
+                for node in component:
+                    self.assertEqual(isFlexible(graph, csr.nodes[node]),
+                                     period == 1)
+
+    def testComponentsMatchDefinition(self):
+        # components of Definition 4.4 taken literally, with all four
+        # orientations checked on the reachability bitsets
+        random.seed(0)
+        for _ in range(200):
+            labels = range(random.randint(1, 4))
+            configurations = list({
+                tuple(sorted(random.choices(labels, k=3)))
+                for _ in range(random.randint(1, 6))
+            })
+            compatibility = get_compatibility([
+                tuple(random.choices(labels, k=2))
+                for _ in range(random.randint(1, 5))
+            ])
+            automaton = create_automaton(configurations, compatibility)
+            nodes = automaton.nodes
+            indptr = automaton.indptr.tolist()
+            indices = automaton.indices.tolist()
+            reach = reachability(indptr, indices)
+            position = {s: i for i, s in enumerate(nodes)}
+            reverse = [position[(s[1], s[0])] for s in nodes]
+            parent = list(range(len(nodes)))
+
+            def find(i):
+                while parent[i] != i:
+                    i = parent[i]
+                return i
+
+            for s in range(len(nodes)):
+                for t in range(len(nodes)):
+                    if (reach[s] >> t & 1 and reach[s] >> reverse[t] & 1
+                            and reach[reverse[s]] >> t & 1
+                            and reach[reverse[s]] >> reverse[t] & 1):
+                        parent[find(s)] = find(t)
+            components = {}
+            for s in range(len(nodes)):
+                components.setdefault(find(s), []).append(s)
+            components = list(components.values())
+            expected = [
+                restrict(configurations, {nodes[i]
+                                          for i in component})
+                for component, period in zip(
+                    components, component_periods(indptr, indices, components))
+                if period == 1
+            ]
+            # a node s that is not in one component with its reversal is a
+            # singleton here and restricts to no configuration at all,
+            # which does not change max_depth
+            self.assertCountEqual([
+                restriction for restriction in unrooted_poly_decider.
+                flexible_scc_restrictions(configurations, compatibility)
+                if restriction
+            ], [restriction for restriction in expected if restriction])
+            # the shared automaton of configurations is used as it is, the
+            # one of a superset is cut down to configurations
+            superset = configurations + [(len(labels), ) * 3]
+            for shared in configurations, superset:
+                automaton = unrooted_poly_decider.shared_automaton(
+                    shared, compatibility)
+                self.assertCountEqual(
+                    unrooted_poly_decider.flexible_scc_restrictions(
+                        configurations, compatibility, automaton=automaton),
+                    unrooted_poly_decider.flexible_scc_restrictions(
+                        configurations, compatibility))
+
+    def testAutomatonMatchesDefinition(self):
+        configurations = [('a', 'b', 'b'), ('a', 'a', 'c'), ('c', 'c', 'c')]
+        edge_configurations = [('b', 'a'), ('c', 'c'), ('a', 'c')]
+        compatibility = get_compatibility(edge_configurations)
+        automaton = create_automaton(configurations, compatibility)
+        self.assertEqual(automaton.indptr[-1], len(automaton.indices))
+        graph = create_graph(configurations, compatibility)
+        for s in graph:
+            expected = [
+                t for t in graph if (s[1], t[0]) in edge_configurations or (
+                    t[0], s[1]) in edge_configurations
+            ]
+            self.assertCountEqual(graph[s], expected)
+
+    def testProblemInterning(self):
+        problem = Problem([('a', 'b', 'b'), ('b', 'a', 'c')], [('a', 'c')])
+        self.assertEqual(problem.labels, ['a', 'b', 'c'])
+        self.assertEqual(problem.configurations(), [(0, 1, 1), (1, 0, 2)])
+        self.assertEqual(problem.edge_configurations(), [(0, 2)])
+        self.assertEqual(problem.bitset({'a', 'c'}), 0b101)
+        self.assertEqual(problem.subset(0b110), {'b', 'c'})
+        self.assertFalse(problem.rooted)
+        self.assertTrue(Problem([('a', 'b', 'b')]).rooted)
+        with self.assertRaises(ValueError):
+            Problem([('a', 'b', 'b'), ('a', 'b')])
+
+    def testProblemManyLabels(self):
+        problem = Problem([(i, i + 1, i + 2) for i in range(0, 70000, 3)])
+        self.assertEqual(problem.configurations()[-1], (69999, 70000, 70001))
+
+    def testClassifyProblem(self):
+        configurations = [("x1", "x1", "y1"), ("a1", "b1", "b1"),
+                          ("b1", "b1", "b1")]
+        edge_configurations = [("a1", "a1"), ("x1", "x1"), ("a1", "b1"),
+                               ("a1", "y1")]
+        self.assertEqual(
+            unrooted_polynomial_classifier(
+                Problem(configurations, edge_configurations)), 1)
+        self.assertEqual(rooted_polynomial_classifier(Problem(configurations)),
+                         rooted_polynomial_classifier(configurations))
+
     def testTwoCol(self):
         self.assertEqual(
             unrooted_polynomial_classifier([(1, 1, 1), (2, 2, 2)], [(1, 2)]),
             1)
 
+    def testHigherDegree(self):
+        self.assertEqual(
+            unrooted_polynomial_classifier([(1, 1, 1, 1), (2, 2, 2, 2)],
+                                           [(1, 2)]), 1)
+        self.assertEqual(
+            rooted_polynomial_classifier([('a', 'b', 'b', 'b'),
+                                          ('b', 'a', 'a', 'a')]), 1)
+        # configurations are multisets, their order does not matter
+        configurations = [(1, 2, 2, 3, 3), (2, 1, 3, 3, 1), (3, 3, 2, 1, 2)]
+        edge_configurations = [(1, 2), (2, 3), (3, 3)]
+        self.assertEqual(
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations),
+            unrooted_polynomial_classifier(
+                [tuple(reversed(conf)) for conf in configurations] * 2,
+                edge_configurations))
+        self.assertEqual(
+            Problem([('a', 'b', 'c'), ('a', 'c', 'b')]).multisets(),
+            [(0, 1, 2)])
+
     def testSqrtProb(self):
         C2 = [("x1", "x1", "y1"), ("x2", "x2", "y2")]
         R2 = [("a1", "b1", "b1"), ("a2", "b2", "b2")]
@@ -222,59 +561,205 @@ class TestE2E(unittest.TestCase):
                          2)  # 2 (rake & compress)
 
     def testProblemGenerationUnrooted(self):
-        def create_k_problem(k):
-            comp_confs = [(f"x{i}", f"x{i}", f"y{i}") for i in range(k)]
-            rake_confs = [(f"a{i}", f"b{i}", f"b{i}") for i in range(k)]
-            rake_star_confs = [(f"b{i}", f"b{i}", f"b{i}") for i in range(k)]
-
-            configurations = list(
-                itertools.chain(comp_confs, rake_confs, rake_star_confs))
-
-            edge_confs_1 = [(f"a{i}", f"a{i}")
-                            for i in range(k)] + [(f"x{i}", f"x{i}")
-                                                  for i in range(k)]
-            edge_confs_2 = [(f"x{i}", f"b{j}") for j in range(k) for i in range(k) if i < j] + \
-                           [(f"x{i}", f"y{j}") for j in range(k) for i in range(k) if i < j]
-            edge_confs_3 = [(f"a{i}", f"b{j}") for j in range(k) for i in range(k) if i <= j] + \
-                           [(f"a{i}", f"y{j}") for j in range(k) for i in range(k) if i <= j]
-            edge_configurations = list(
-                itertools.chain(edge_confs_1, edge_confs_2, edge_confs_3))
-            return configurations, edge_configurations
-
         for i in range(6):
-            configurations, edge_configurations = create_k_problem(i)
+            configurations, edge_configurations = create_unrooted_k_problem(i)
             self.assertEqual(
                 unrooted_polynomial_classifier(configurations,
                                                edge_configurations), i)
+        configurations, edge_configurations = create_unrooted_k_problem(3)
+        self.assertEqual(
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations,
+                                           workers=2), 3)
 
-    def testProblemGenerationRooted(self):
-        def create_k_problem(k):
-            configurations = []
-
-            def gen(l, s, t):
-                return [f'{l}{j}' for j in range(s, t + 1)]
-
-            for i in range(1, k + 1):
-                ss = gen('a', 1, i - 1) + gen('b', 1, i) + gen('x', 1, i - 1)
-                for s1 in ss:
-                    for s2 in ss:
-                        configurations.append([f'a{i}', s1, s2])
-            for i in range(1, k + 1):
-                ss = gen('a', 1, i) + gen('b', 1, i - 1) + gen('x', 1, i - 1)
-                for s1 in ss:
-                    for s2 in ss:
-                        configurations.append([f'b{i}', s1, s2])
-            for i in range(1, k):
-                ss1 = gen('a', 1, k) + gen('b', 1, k) + gen('x', 1, k - 1)
-                ss2 = gen('a', 1, i) + gen('b', 1, i) + gen('x', 1, i - 1)
-                for s1 in ss1:
-                    for s2 in ss2:
-                        configurations.append([f'x{i}', s1, s2])
-            return configurations
+    def testDeepRecursion(self):
+        # the max_depth recursion must not use the Python stack
+        k = 40
+        configurations, edge_configurations = create_unrooted_k_problem(k)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(len(inspect.stack()) + 50)
+        try:
+            k_found = unrooted_polynomial_classifier(configurations,
+                                                     edge_configurations)
+        finally:
+            sys.setrecursionlimit(limit)
+        self.assertEqual(k_found, k)
 
+    def testProblemGenerationRooted(self):
         for i in range(6):
-            configurations = create_k_problem(i)
+            configurations = create_rooted_k_problem(i)
             self.assertEqual(rooted_polynomial_classifier(configurations), i)
+        self.assertEqual(
+            rooted_polynomial_classifier(create_rooted_k_problem(3), workers=2), 3)
+
+    def testLRUCache(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3  # evicts 'b', the least recently used key
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 2)
+
+    def testCacheAcrossCalls(self):
+        cache = LRUCache()
+        configurations = [('a', 'b', 'b'), ('b', 'a', 'a'), ('b', 'b', 'b')]
+        edge_configurations = [('a', 'b'), ('b', 'b')]
+        for _ in range(2):
+            self.assertEqual(
+                unrooted_polynomial_classifier(configurations,
+                                               edge_configurations,
+                                               cache=cache),
+                unrooted_polynomial_classifier(configurations,
+                                               edge_configurations))
+            self.assertEqual(
+                rooted_polynomial_classifier(configurations, cache=cache),
+                rooted_polynomial_classifier(configurations))
+        self.assertGreater(len(cache), 0)
+
+    def testStats(self):
+        configurations = [('a', 'b', 'b'), ('b', 'a', 'a'), ('b', 'b', 'b')]
+        edge_configurations = [('a', 'b'), ('b', 'b')]
+        stats = Stats()
+        self.assertEqual(
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations,
+                                           stats=stats),
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations))
+        for phase in [
+                'trim', 'shared_automaton', 'automaton', 'scc', 'flexibility',
+                'restrict'
+        ]:
+            self.assertIn(phase, stats.timings)
+        self.assertEqual(stats.depth, 0)
+        self.assertGreater(stats.max_depth, 0)
+        # one automaton per subproblem, all of them below the top level
+        self.assertEqual(len(stats.graphs), stats.calls['subproblems'])
+        self.assertEqual(stats.calls['shared_automaton'], 1)
+        self.assertNotIn(0, [depth for depth, _, _ in stats.graphs])
+        stats = Stats()
+        self.assertEqual(
+            rooted_polynomial_classifier(configurations, stats=stats),
+            rooted_polynomial_classifier(configurations))
+        self.assertEqual(len(stats.graphs), stats.calls['automaton'])
+        self.assertEqual(len(stats.graphs), stats.calls['subproblems'])
+        self.assertNotIn(0, [depth for depth, _, _ in stats.graphs])
+        self.assertIn('levels', stats.as_dict())
+
+    def testWitness(self):
+        random.seed(0)
+        for _ in range(300):
+            labels = range(random.randint(1, 4))
+            configurations = [
+                tuple(random.choices(labels, k=3))
+                for _ in range(random.randint(1, 8))
+            ]
+            edge_configurations = [
+                tuple(random.choices(labels, k=2))
+                for _ in range(random.randint(1, 5))
+            ]
+            for classify, arguments, subproblem in [
+                (rooted_polynomial_classifier, (configurations, ), 'labels'),
+                (unrooted_polynomial_classifier,
+                 (configurations, edge_configurations), 'configurations')
+            ]:
+                witness = []
+                k = classify(*arguments, witness=witness)
+                self.assertEqual(k, classify(*arguments))
+                if k == 0:
+                    self.assertEqual(witness, [])
+                    continue
+                # every step of a deepest branch is one level shallower
+                self.assertEqual(
+                    [step['k'] for step in witness], [k] *
+                    len(witness) if k == math.inf else list(range(k, 0, -1)))
+                if k == math.inf:
+                    self.assertEqual(sorted(witness[-1]['restriction']),
+                                     sorted(witness[-1][subproblem]))
+
+    def testBudget(self):
+        class CheckBudget(Budget):
+            # runs out after a number of checks
+            def __init__(self, checks):
+                super().__init__()
+                self.checks = checks
+
+            def check(self, nodes=None, allocate=None):
+                self.checks -= 1
+                if self.checks < 0:
+                    raise OutOfBudget("time")
+
+        k = 8
+        configurations, edge_configurations = create_unrooted_k_problem(k)
+        bounds = []
+        for checks in range(0, 1000, 10):
+            result = unrooted_polynomial_classifier(
+                configurations, edge_configurations, budget=CheckBudget(checks))
+            if not isinstance(result, BudgetExceeded):
+                self.assertEqual(result, k)
+                break
+            self.assertEqual(result.reason, "time")
+            bounds.append(result.lower_bound)
+        else:
+            self.fail("budget never sufficed")
+        # the lower bounds grow with the budget and never exceed k
+        self.assertEqual(bounds, sorted(bounds))
+        self.assertEqual(bounds[0], 0)
+        self.assertEqual(bounds[-1], k)
+
+        self.assertEqual(
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations,
+                                           budget=Budget(seconds=0)),
+            BudgetExceeded("time", 0))
+        self.assertEqual(
+            unrooted_polynomial_classifier(configurations,
+                                           edge_configurations,
+                                           budget=Budget(nodes=10)),
+            BudgetExceeded("nodes", 0))
+        self.assertEqual(
+            rooted_polynomial_classifier([('a', 'b', 'b'), ('b', 'a', 'a')],
+                                         budget=Budget(nodes=1)),
+            BudgetExceeded("nodes", 0))
+        # the edges of the automaton would need far more than the memory
+        # budget, which is noticed before they are allocated
+        random.seed(0)
+        dense = [
+            tuple(random.choices(range(60), k=3)) for _ in range(2000)
+        ]
+        everything = list(itertools.combinations_with_replacement(range(60), 2))
+        self.assertEqual(
+            unrooted_polynomial_classifier(dense,
+                                           everything,
+                                           budget=Budget(memory=2**20)),
+            BudgetExceeded("memory", 0))
+        with Budget(memory=2**20):
+            check_budget(allocate=2**10)
+            with self.assertRaises(OutOfBudget):
+                check_budget(allocate=2**30)
+        budget = Budget(seconds=60, nodes=1000, memory=2**30)
+        for _ in range(2):  # a budget can be reused
+            self.assertEqual(
+                unrooted_polynomial_classifier(configurations,
+                                               edge_configurations,
+                                               budget=budget), k)
+        self.assertEqual(
+            rooted_polynomial_classifier([('a', 'a', 'a')], budget=budget),
+            math.inf)
+
+        problem = b'{"id": 0, "configurations": [["a", "b", "b"], ["b", "a", "a"]]}\n'
+        result = subprocess.run([
+            sys.executable, '-m', 'poly_classifier', '--batch', '-',
+            '--max-nodes', '1'
+        ],
+                                input=problem,
+                                capture_output=True)
+        [record] = map(json.loads, result.stdout.decode('utf-8').splitlines())
+        self.assertEqual(record['budget_exceeded'], 'nodes')
+        self.assertEqual(record['k_lower_bound'], 0)
+        self.assertNotIn('k', record)
 
     def testRandomUnrooted(self):
         total = 30
@@ -325,6 +810,83 @@ class TestE2E(unittest.TestCase):
                         break
             self.assertEqual(k, float('inf'))
 
+    def testIncrementalRooted(self):
+        for seed in range(4):
+            random.seed(seed)
+            configurations = [
+                tuple(random.choices(string.ascii_lowercase[:8], k=3))
+                for _ in range(40)
+            ]
+            classifier = IncrementalRootedClassifier()
+            for i, conf in enumerate(configurations):
+                classifier.add_configuration(conf)
+                self.assertEqual(
+                    classifier.complexity(),
+                    rooted_polynomial_classifier(configurations[:i + 1]))
+
+    def testIncrementalUnrooted(self):
+        for seed in range(4):
+            random.seed(seed)
+            ss = string.ascii_lowercase[:8]
+            configurations = [
+                tuple(random.choices(ss, k=3)) for _ in range(25)
+            ]
+            edge_configurations = [
+                tuple(random.choices(ss, k=2)) for _ in range(25)
+            ]
+            classifier = IncrementalUnrootedClassifier(memo_size=2)
+            for i in range(25):
+                classifier.add_configuration(configurations[i])
+                classifier.add_edge_configuration(edge_configurations[i])
+                self.assertEqual(
+                    classifier.complexity(),
+                    unrooted_polynomial_classifier(
+                        configurations[:i + 1], edge_configurations[:i + 1]))
+                self.assertLessEqual(len(classifier._memo), 2)
+
+    def testIncrementalRejectsInvalid(self):
+        # a rejected configuration is not recorded
+        classifier = IncrementalUnrootedClassifier([('a', 'b', 'b')],
+                                                   [('a', 'b')])
+        with self.assertRaises(ValueError):
+            classifier.add_configuration(('a', 'b'))
+        with self.assertRaises(ValueError):
+            classifier.add_edge_configuration(('a', 'b', 'b'))
+        self.assertEqual(classifier.configurations, [('a', 'b', 'b')])
+        self.assertEqual(classifier.edge_configurations, [('a', 'b')])
+        rooted = IncrementalRootedClassifier([('a', 'b', 'b')])
+        with self.assertRaises(ValueError):
+            rooted.add_configuration(('a', 'b'))
+        self.assertEqual(rooted.configurations, [('a', 'b', 'b')])
+
+    def testIncrementalComponents(self):
+        # components and periods after every insertion match a full search
+        for seed in range(100):
+            random.seed(seed)
+            order = random.sample(range(20), 20)
+            components = IncrementalComponents()
+            graph = {}
+            for _ in range(60):
+                if not graph or random.random() < 0.25 and len(graph) < 20:
+                    node = order[len(graph)]
+                    graph[node] = []
+                    components.add_node(node)
+                else:
+                    u, v = random.choices(list(graph), k=2)
+                    if v in graph[u]:
+                        continue
+                    graph[u].append(v)
+                    components.add_edge(u, v)
+                csr = from_dict(graph)
+                expected = csr_strongly_connected_components(
+                    csr.indptr, csr.indices)
+                periods = component_periods(csr.indptr, csr.indices, expected)
+                self.assertEqual(
+                    sorted((sorted(nodes), period)
+                           for nodes, period in components.components()),
+                    sorted((sorted(csr.nodes[i] for i in component), period)
+                           for component, period in zip(expected, periods)))
+
     def testSqrtRooted1(self):
         result = subprocess.run([sys.executable, '-m', 'poly_classifier'],
                                 input=sqrt_rooted_1,
@@ -332,6 +894,18 @@ class TestE2E(unittest.TestCase):
         lines = str(result.stdout.decode('utf-8')).split('\n')
         self.assertEqual(lines[-2], "Problem Π is Θ(n^(1/2)) round solvable.")
 
+    def testSqrtRooted1Explain(self):
+        result = subprocess.run(
+            [sys.executable, '-m', 'poly_classifier', '--explain'],
+            input=sqrt_rooted_1,
+            capture_output=True)
+        lines = str(result.stdout.decode('utf-8')).split('\n')
+        self.assertTrue(lines[-4].startswith("k = 2 on "))
+        self.assertIn("restricted to", lines[-4])
+        self.assertTrue(lines[-3].startswith("k = 1 on "))
+        self.assertTrue(lines[-3].endswith(", no flexible SCC"))
+        self.assertEqual(lines[-2], "Problem Π is Θ(n^(1/2)) round solvable.")
+
     def testSqrtRooted2(self):
         result = subprocess.run([sys.executable, '-m', 'poly_classifier'],
                                 input=sqrt_rooted_2,
@@ -384,6 +958,444 @@ class TestE2E(unittest.TestCase):
         self.assertEqual(lines[-2],
                          "Problem Π is 'unsolvable in a strict sense'.")
 
+    def testBatch(self):
+        problems = b"""{"id": 0, "configurations": [["a", "a", "b"], ["b", "a", "a"]]}
+{"id": 1, "configurations": [[1, 1, 1], [2, 2, 2]], "edge_configurations": [[1, 2]]}
+{"configurations": [["a", "b", "b"]], "edge_configurations": [["a", "a"]]}
+"""
+        result = subprocess.run(
+            [sys.executable, '-m', 'poly_classifier', '--batch', '-'],
+            input=problems,
+            capture_output=True)
+        results = [
+            json.loads(line)
+            for line in result.stdout.decode('utf-8').splitlines()
+        ]
+        self.assertEqual([r.get('id') for r in results], [0, 1, None])
+        self.assertEqual([r['type'] for r in results],
+                         ['rooted', 'unrooted', 'unrooted'])
+        self.assertEqual([r['k'] for r in results], ['inf', 1, 0])
+
+    def testBatchMalformedLine(self):
+        # a line that is not JSON yields an error record, not an abort
+        problems = b"""{"id": 1, "configurations": [["a", "a", "a"]]}
+not json
+{"id": 3, "configurations": [["a", "b", "b"]]}
+"""
+        for options in [[], ['--workers', '2']]:
+            result = subprocess.run(
+                [sys.executable, '-m', 'poly_classifier', '--batch', '-'] +
+                options,
+                input=problems,
+                capture_output=True)
+            self.assertEqual(result.returncode, 0)
+            results = [
+                json.loads(line)
+                for line in result.stdout.decode('utf-8').splitlines()
+            ]
+            self.assertEqual([r.get('id') for r in results], [1, None, 3])
+            self.assertEqual([r.get('k') for r in results], ['inf', None, 0])
+            self.assertTrue(results[1]['error'].startswith('line 2: '))
+        # configurations that are not lists of lists are errors too
+        for problem in [{
+                "configurations": "abc"
+        }, {
+                "configurations": [["a", "a", "a"]],
+                "edge_configurations": "aa"
+        }, {
+                "configurations": [["a", "a", "a"], "aaa"]
+        }, {}, []]:
+            self.assertIn('error', classify_record(problem))
+        self.assertEqual(
+            classify_record({"configurations": [["a", "a", "a"]]})['k'],
+            math.inf)
+
+    def testParser(self):
+        text = """a : b b
+b: a a
+
+1 1 1
+2 2 2
+
+1 2
+---
+x y y
+---
+
+a: a a
+"""
+        problems = list(parser.read_problems(io.StringIO(text)))
+        self.assertEqual([problem.rooted for problem in problems],
+                         [True, False, False, True])
+        self.assertEqual(problems[1].labels, ['1', '2'])
+        self.assertEqual(problems[1].edge_configurations(), [(0, 1)])
+        self.assertEqual(problems[2].edge_configurations(), [])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'problems.txt')
+            with open(path, 'w') as file:
+                file.write(text)
+            self.assertEqual([
+                problem.configurations()
+                for problem in parser.read_problem_file(path)
+            ], [problem.configurations() for problem in problems])
+        with self.assertRaises(ValueError):
+            list(parser.read_problems(["a: b b", "a b b"]))
+        result = subprocess.run([
+            sys.executable, '-m', 'poly_classifier', '--batch', '-',
+            '--format', 'text'
+        ],
+                                input=text.encode('utf-8'),
+                                capture_output=True)
+        self.assertEqual([
+            json.loads(line)['k']
+            for line in result.stdout.decode('utf-8').splitlines()
+        ], [1, 1, 0, 'inf'])
+
+    def testParserMalformed(self):
+        # a malformed problem is reported and reading goes on after its end
+        text = """a: a a
+
+1 1 1
+2 2
+
+1 2
+---
+x: y y
+x y y
+
+b: b b
+"""
+        problems = list(
+            parser.read_problems(io.StringIO(text), skip_malformed=True))
+        self.assertEqual([type(problem) for problem in problems],
+                         [Problem, ValueError, ValueError, Problem])
+        self.assertEqual(problems[3].labels, ['b'])
+        result = subprocess.run([
+            sys.executable, '-m', 'poly_classifier', '--batch', '-',
+            '--format', 'text'
+        ],
+                                input=text.encode('utf-8'),
+                                capture_output=True)
+        self.assertEqual(result.returncode, 0)
+        results = [
+            json.loads(line)
+            for line in result.stdout.decode('utf-8').splitlines()
+        ]
+        self.assertEqual([r.get('k') for r in results],
+                         ['inf', None, None, 'inf'])
+        self.assertTrue(results[1]['error'].startswith('line 4: '))
+        self.assertTrue(results[2]['error'].startswith('line 9: '))
+        # a rooted problem whose first line lacks the colon is a single block
+        problems = list(
+            parser.read_problems(io.StringIO(
+                "a b b\na: b b\n\nx: y y\n\nz: z z\n"),
+                                 skip_malformed=True))
+        self.assertEqual([type(problem) for problem in problems],
+                         [ValueError, Problem, Problem])
+        self.assertEqual([problem.labels for problem in problems[1:]],
+                         [['x', 'y'], ['z']])
+        # every problem of the input, malformed or not, gives one record
+        blocks = [
+            "a: a a", "a b b\na: b b", "1 1 1\n\n1 1", "x: y y\nx y y",
+            "1 1 1\n2 2\n\n1 2", "1 1 1\n\n1 2 3", "b: b\nb: b b", "c: c c"
+        ]
+        result = subprocess.run([
+            sys.executable, '-m', 'poly_classifier', '--batch', '-',
+            '--format', 'text'
+        ],
+                                input="\n\n".join(blocks).encode('utf-8'),
+                                capture_output=True)
+        results = [
+            json.loads(line)
+            for line in result.stdout.decode('utf-8').splitlines()
+        ]
+        self.assertEqual(['error' in r for r in results],
+                         [False, True, False, True, True, True, True, False])
+
+    def testBranchPool(self):
+        with BranchPool(2) as pool:
+            self.assertEqual(pool.max(float, [('1', ), ('3', ), ('2', )]), 3)
+        with BranchPool(2) as pool:
+            self.assertEqual(pool.max(float, [('1', ), ('inf', ), ('2', )]),
+                             float('inf'))
+
+    def testClassifyMany(self):
+        two_coloring = {
+            "configurations": [[1, 1, 1], [2, 2, 2]],
+            "edge_configurations": [[1, 2]]
+        }
+        problems = (dict(two_coloring, id=i) if i % 2 else {
+            "id": i,
+            "configurations": [["a", "a", "b"], ["b", "a", "a"]]
+        } for i in range(10))
+        results = list(classify_many(problems, workers=2, chunksize=3))
+        self.assertEqual([r['index'] for r in results], list(range(10)))
+        self.assertEqual([r['id'] for r in results], list(range(10)))
+        self.assertEqual([r['k'] for r in results], [float('inf'), 1] * 5)
+        results = classify_many([two_coloring] * 4, workers=2, ordered=False)
+        self.assertCountEqual([r['index'] for r in results], range(4))
+
+    def testClassifyManyError(self):
+        # an unexpected error fails only its problem, not the whole sweep
+        problems = [{"id": i, "configurations": [["a", "a", "a"]]}
+                    for i in range(3)]
+        results = list(
+            classify_many(problems,
+                          workers=1,
+                          chunksize=2,
+                          budget=FailingBudget()))
+        self.assertEqual(results, [{
+            "id": i,
+            "error": "MemoryError()",
+            "index": i
+        } for i in range(3)])
+
+    def testClassifyManyTimeout(self):
+        configurations = [(f"x{i}", f"x{i}", f"y{i}") for i in range(5)]
+        edge_configurations = [(f"x{i}", f"y{j}") for j in range(5)
+                               for i in range(5) if i < j]
+        problem = {
+            "configurations": configurations,
+            "edge_configurations": edge_configurations
+        }
+        [result] = classify_many([problem], workers=1, timeout=1e-6)
+        self.assertEqual(result, {"error": "timeout", "index": 0})
+        # a timeout must not interrupt the worker importing numpy, which
+        # would break every later unrooted problem of that worker; run in a
+        # fresh interpreter, whose workers have not imported numpy yet
+        script = """
+import json
+from poly_classifier.parallel import classify_many
+two_coloring = {
+    "configurations": [[1, 1, 1], [2, 2, 2]],
+    "edge_configurations": [[1, 2]]
+}
+print(json.dumps(list(
+    classify_many([two_coloring] * 2, workers=1, chunksize=2, timeout=0.02))))
+"""
+        for _ in range(3):
+            result = subprocess.run([sys.executable, '-c', script],
+                                    capture_output=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual([
+                result.get("k", result.get("error"))
+                for result in json.loads(result.stdout)
+            ], [1, 1])
+
+    def testServer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'classifier.sock')
+            server = subprocess.Popen([
+                sys.executable, '-m', 'poly_classifier', 'serve', '--socket',
+                path, '--workers', '2'
+            ])
+            try:
+                for _ in range(100):
+                    if os.path.exists(path):
+                        break
+                    time.sleep(0.1)
+                two_coloring = {
+                    "configurations": [[1, 1, 1], [2, 2, 2]],
+                    "edge_configurations": [[1, 2]]
+                }
+                relabeled = {
+                    "configurations": [["b", "b", "b"], ["a", "a", "a"]],
+                    "edge_configurations": [["a", "b"]]
+                }
+                rooted = {"configurations": [["a", "a", "a"]]}
+                results = classify_remote(
+                    path,
+                    [two_coloring, relabeled, {
+                        "configurations": 1
+                    }, rooted] * 3)
+                self.assertEqual([r.get('k') for r in results],
+                                 [1, 1, None, math.inf] * 3)
+                self.assertIn('error', results[2])
+                # isomorphic problems are classified only once
+                self.assertEqual(
+                    sum('coalesced' in r or 'cached' in r
+                        for r in results[:2] + results[4:6] + results[8:10]),
+                    5)
+            finally:
+                server.terminate()
+                server.wait()
+            self.assertFalse(os.path.exists(path))
+
+    def testServerTimeouts(self):
+        # timeouts never leave a worker unable to classify unrooted problems
+        # (see testClassifyManyTimeout)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'classifier.sock')
+            server = subprocess.Popen([
+                sys.executable, '-m', 'poly_classifier', 'serve', '--socket',
+                path, '--workers', '1', '--timeout', '0.01'
+            ])
+            try:
+                for _ in range(100):
+                    if os.path.exists(path):
+                        break
+                    time.sleep(0.1)
+                # colorings with 2, 3 and 4 colors, so nothing is coalesced
+                problems = [{
+                    "configurations": [[c, c, c] for c in range(n)],
+                    "edge_configurations":
+                    [[c, d] for c in range(n) for d in range(c + 1, n)]
+                } for n in range(2, 5)]
+                for result in classify_remote(path, problems):
+                    if 'k' not in result:
+                        self.assertEqual(result, {'error': 'timeout'})
+            finally:
+                server.terminate()
+                server.wait()
+
+    def testServerIdleConnections(self):
+        # connections waiting for a request must not use up max_pending,
+        # nor make the server shut down noisily
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'classifier.sock')
+            server = subprocess.Popen([
+                sys.executable, '-m', 'poly_classifier', 'serve', '--socket',
+                path, '--workers', '1', '--max-pending', '2'
+            ], stderr=subprocess.PIPE)
+            idle = []
+            try:
+                for _ in range(100):
+                    if os.path.exists(path):
+                        break
+                    time.sleep(0.1)
+                for _ in range(2):
+                    connection = socket.socket(socket.AF_UNIX)
+                    connection.connect(path)
+                    idle.append(connection)
+
+                async def run():
+                    async with Client(path) as client:
+                        return await asyncio.wait_for(
+                            client.classify(
+                                {"configurations": [["a", "a", "a"]]}), 30)
+
+                self.assertEqual(asyncio.run(run())['k'], math.inf)
+            finally:
+                # terminated with the idle connections still open
+                server.terminate()
+                stderr = server.communicate()[1]
+                for connection in idle:
+                    connection.close()
+            self.assertNotIn(b'Traceback', stderr)
+
+    def testCanonicalFormIsRelabelingInvariant(self):
+        for seed in range(100):
+            random.seed(seed)
+            ss = string.ascii_lowercase[:random.randint(1, 8)]
+            configurations = [
+                tuple(random.choices(ss, k=3))
+                for _ in range(random.randint(1, 10))
+            ]
+            edge_configurations = [
+                tuple(random.choices(ss, k=2))
+                for _ in range(random.randint(0, 8))
+            ]
+            relabeling = dict(zip(ss, random.sample(ss.upper(), len(ss))))
+            rooted = [(relabeling[conf[0]], relabeling[conf[2]],
+                       relabeling[conf[1]]) for conf in configurations]
+            unrooted = [
+                tuple(relabeling[label] for label in reversed(conf))
+                for conf in configurations
+            ]
+            edges = [(relabeling[b], relabeling[a])
+                     for a, b in edge_configurations]
+            random.shuffle(rooted)
+            self.assertEqual(canonical_key(configurations),
+                             canonical_key(rooted))
+            self.assertEqual(
+                canonical_key(configurations, edge_configurations),
+                canonical_key(unrooted, edges))
+        self.assertNotEqual(canonical_key([('a', 'a', 'b')]),
+                            canonical_key([('a', 'b', 'b')]))
+        self.assertNotEqual(canonical_key([('a', 'a', 'b')]),
+                            canonical_key([('a', 'a', 'b')], []))
+
+    def testCanonicalKeyOfSymmetricProblem(self):
+        # 3-coloring: all permutations of the colors are automorphisms
+        coloring = [(a, b, c) for a in 'abc' for b in 'abc' for c in 'abc'
+                    if a not in (b, c)]
+        relabeling = {'a': 'z', 'b': 'x', 'c': 'y'}
+        relabeled = [tuple(relabeling[label] for label in conf)
+                     for conf in coloring]
+        self.assertIsNotNone(canonical_key(coloring))
+        self.assertEqual(canonical_key(coloring), canonical_key(relabeled))
+        # 40 independent 2-colorings: far too symmetric to key, which must
+        # be found out quickly
+        configurations = []
+        for i in range(40):
+            configurations += [(f'a{i}', f'b{i}', f'b{i}'),
+                               (f'b{i}', f'a{i}', f'a{i}')]
+        start = time.perf_counter()
+        self.assertIsNone(canonical_key(configurations))
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def testCanonicalKeyIsCheap(self):
+        # the key of the k-families is found at a cost comparable to their
+        # classification, not many times it
+        def best_time(function, *args):
+            times = []
+            for _ in range(3):
+                start = time.perf_counter()
+                function(*args)
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        for k in range(2, 9):
+            configurations = create_rooted_k_problem(k)
+            self.assertIsNotNone(canonical_key(configurations))
+            self.assertLess(
+                best_time(canonical_key, configurations),
+                10 * best_time(rooted_polynomial_classifier, configurations)
+                + 0.01)
+            configurations, edge_configurations = create_unrooted_k_problem(k)
+            self.assertIsNotNone(
+                canonical_key(configurations, edge_configurations))
+            self.assertLess(
+                best_time(canonical_key, configurations, edge_configurations),
+                10 * best_time(unrooted_polynomial_classifier, configurations,
+                               edge_configurations) + 0.01)
+
+    def testResultCache(self):
+        problems = b"""{"id": 1, "configurations": [[1, 1, 1], [2, 2, 2]], "edge_configurations": [[1, 2]]}
+{"id": 2, "configurations": [["b", "b", "b"], ["a", "a", "a"]], "edge_configurations": [["a", "b"]]}
+"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            cache = ResultCache(path)
+            cache['x'] = float('inf')
+            cache['y'] = 3
+            self.assertEqual(cache.get('x'), float('inf'))
+            self.assertEqual(ResultCache(path).get('y'), 3)
+            self.assertIsNone(cache.get('z'))
+            result = subprocess.run([
+                sys.executable, '-m', 'poly_classifier', '--batch', '-',
+                '--cache', path
+            ],
+                                    input=problems,
+                                    capture_output=True)
+            results = [
+                json.loads(line)
+                for line in result.stdout.decode('utf-8').splitlines()
+            ]
+            self.assertEqual([r['k'] for r in results], [1, 1])
+            self.assertEqual([r.get('cached', False) for r in results],
+                             [False, True])
+            self.assertEqual(len(cache), 3)
+            cache.close()
+
+    def testLazyImports(self):
+        result = subprocess.run([
+            sys.executable, '-c',
+            'import sys, poly_classifier; print(sorted({"numpy", "networkx", "sqlite3", "multiprocessing"} & set(sys.modules)))'
+        ],
+                                capture_output=True)
+        self.assertEqual(result.stdout.decode('utf-8').strip(), '[]')
+
     def testBigInputV1(self):
         result = subprocess.run([sys.executable, '-m', 'poly_classifier'],
                                 input=big_input_v1,